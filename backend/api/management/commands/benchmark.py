@@ -0,0 +1,416 @@
+import base64
+import io
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from foodgram.query_budget import (
+    BUDGET_CACHES,
+    get_endpoint_budget,
+    get_report
+)
+from recipes.models import Ingredients, Recipes, ShoppingCart, Tags
+from users.models import FoodgramUser
+
+
+def get_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), '#E26C2D').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the main API flows against the current database and '
+        'report latency, query counts and memory per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Measured requests per endpoint.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Unmeasured requests per endpoint before measuring.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Compare the results against this JSON file.',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed relative latency growth over the baseline.',
+        )
+        parser.add_argument(
+            '--check-budgets',
+            action='store_true',
+            help='Fail when an endpoint runs more queries than its budget.',
+        )
+        parser.add_argument(
+            '--check-plans',
+            action='store_true',
+            help=(
+                'Fail when a recipe list page is not read through an '
+                'index in the order of the list.'
+            ),
+        )
+
+    def prepare(self):
+        """Pick a user with a shopping cart and objects to act on."""
+        user_id = ShoppingCart.objects.values_list('user', flat=True).first()
+        if user_id is None:
+            raise CommandError(
+                'The database has no shopping carts, run seed_data first'
+            )
+        user = FoodgramUser.objects.get(pk=user_id)
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        tags = list(Tags.objects.values_list('id', 'slug')[:2])
+        ingredient_ids = Ingredients.objects.values_list(
+            'id', flat=True
+        )[:3]
+        self.recipe_payload = {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 100}
+                for ingredient_id in ingredient_ids
+            ],
+            'tags': [tag_id for tag_id, _ in tags],
+            'image': get_image(),
+            'name': 'Benchmark recipe',
+            'text': 'Benchmark recipe text',
+            'cooking_time': 30,
+        }
+        response = self.client.post(
+            '/api/recipes/',
+            self.recipe_payload,
+            content_type='application/json'
+        )
+        if response.status_code != 201:
+            raise CommandError(f'Cannot create a recipe: {response.content}')
+        self.own_recipe_id = response.json()['id']
+        self.other_recipe_id = Recipes.objects.exclude(
+            favorite__user=user
+        ).exclude(
+            shopping_cart__user=user
+        ).exclude(author=user).values_list('id', flat=True).first()
+        self.author_id = FoodgramUser.objects.exclude(
+            followers__subscriber=user
+        ).exclude(pk=user.pk).values_list('id', flat=True).first()
+        self.user = user
+        self.tag_slugs = [slug for _, slug in tags]
+
+    def get_flows(self):
+        """
+        Requests replayed in order on every iteration: the successful
+        requests of postman-collection/ and the list variants added
+        since. The collection itself registers fixed users and checks
+        error responses, so it cannot be replayed in a loop.
+        """
+        recipe = self.other_recipe_id
+        tags = '&'.join(f'tags={slug}' for slug in self.tag_slugs)
+        payload = self.recipe_payload
+        return [
+            ('recipes-list', 'get', '/api/recipes/?limit=6', None),
+            (
+                'recipes-list-tags',
+                'get',
+                f'/api/recipes/?limit=6&{tags}',
+                None
+            ),
+            (
+                'recipes-list-favorited',
+                'get',
+                '/api/recipes/?limit=6&is_favorited=1',
+                None
+            ),
+            (
+                'recipes-list-cart',
+                'get',
+                '/api/recipes/?limit=6&is_in_shopping_cart=1',
+                None
+            ),
+            (
+                'recipes-list-author',
+                'get',
+                f'/api/recipes/?limit=6&author={self.user.pk}',
+                None
+            ),
+            (
+                'recipes-list-popular',
+                'get',
+                '/api/recipes/?limit=6&ordering=popular',
+                None
+            ),
+            (
+                'recipes-list-newest',
+                'get',
+                '/api/recipes/?limit=6&ordering=newest',
+                None
+            ),
+            (
+                'recipes-list-cooking-time',
+                'get',
+                '/api/recipes/?limit=6&ordering=cooking_time',
+                None
+            ),
+            (
+                'recipes-list-author-newest',
+                'get',
+                f'/api/recipes/?limit=6&author={self.user.pk}'
+                '&ordering=newest',
+                None
+            ),
+            ('recipes-detail', 'get', f'/api/recipes/{recipe}/', None),
+            ('recipes-create', 'post', '/api/recipes/', payload),
+            (
+                'recipes-update',
+                'patch',
+                f'/api/recipes/{self.own_recipe_id}/',
+                payload
+            ),
+            ('favorite-add', 'post', f'/api/recipes/{recipe}/favorite/', None),
+            (
+                'favorite-remove',
+                'delete',
+                f'/api/recipes/{recipe}/favorite/',
+                None
+            ),
+            (
+                'shopping-cart-add',
+                'post',
+                f'/api/recipes/{recipe}/shopping_cart/',
+                None
+            ),
+            (
+                'shopping-cart-remove',
+                'delete',
+                f'/api/recipes/{recipe}/shopping_cart/',
+                None
+            ),
+            (
+                'shopping-cart-download',
+                'get',
+                '/api/recipes/download_shopping_cart/',
+                None
+            ),
+            (
+                'subscriptions',
+                'get',
+                '/api/users/subscriptions/?limit=6&recipes_limit=3',
+                None
+            ),
+            (
+                'subscribe',
+                'post',
+                f'/api/users/{self.author_id}/subscribe/',
+                None
+            ),
+            (
+                'unsubscribe',
+                'delete',
+                f'/api/users/{self.author_id}/subscribe/',
+                None
+            ),
+            ('tags', 'get', '/api/tags/', None),
+            ('ingredients-search', 'get', '/api/ingredients/?name=ма', None),
+        ]
+
+    def request(self, method, url, payload):
+        response = getattr(self.client, method)(
+            url,
+            json.dumps(payload) if payload is not None else None,
+            content_type='application/json'
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {url} returned {response.status_code}'
+            )
+        return response
+
+    def measure(self, flows, iterations, warmup):
+        samples = {name: [] for name, *_ in flows}
+        self.captured = {}
+        for iteration in range(warmup + iterations):
+            for name, method, url, payload in flows:
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    self.request(method, url, payload)
+                    elapsed = time.perf_counter() - started
+                if iteration >= warmup:
+                    samples[name].append(elapsed * 1000)
+                    self.captured[name] = context.captured_queries
+        memory = {}
+        tracemalloc.start()
+        for name, method, url, payload in flows:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.request(method, url, payload)
+            peak = tracemalloc.get_traced_memory()[1]
+            memory[name] = (peak - current) // 1024
+        tracemalloc.stop()
+        return {
+            name: {
+                'p50_ms': round(percentile(values, 0.5), 2),
+                'p90_ms': round(percentile(values, 0.9), 2),
+                'p99_ms': round(percentile(values, 0.99), 2),
+                'mean_ms': round(statistics.mean(values), 2),
+                'queries': len(self.captured[name]),
+                'peak_memory_kb': memory[name],
+            }
+            for name, values in samples.items()
+        }
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name}: {before["queries"]} -> '
+                    f'{result["queries"]} queries'
+                )
+            if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p50 {before["p50_ms"]} -> '
+                    f'{result["p50_ms"]} ms'
+                )
+        return regressions
+
+    def check_budgets(self, flows):
+        reports = []
+        for name, method, url, _ in flows:
+            budget = get_endpoint_budget(url, method)
+            if budget is None:
+                reports.append(f'{method.upper()} {url} has no query budget')
+            elif len(self.captured[name]) > budget:
+                reports.append(get_report(
+                    self.captured[name], budget, f'{method.upper()} {url}'
+                ))
+        return reports
+
+    def get_page_query(self, name):
+        """The query that reads the recipes of a list page."""
+        for query in self.captured[name]:
+            sql = query['sql']
+            if (
+                sql.startswith(f'SELECT {self.recipes_table}.')
+                and ' LIMIT ' in sql
+            ):
+                return sql
+        return None
+
+    def check_plans(self, flows):
+        """
+        EXPLAIN the page query of every recipe list flow. Lists filtered
+        by tags or by the user's favorites or cart may start from those
+        rows and sort them when they are few, the others must read the
+        recipes in list order.
+        """
+        reports = []
+        for name, method, url, _ in flows:
+            if not name.startswith('recipes-list'):
+                continue
+            sql = self.get_page_query(name)
+            if sql is None:
+                reports.append(f'{url}: no recipe page query')
+                continue
+            with connection.cursor() as cursor:
+                # Small seeds would be scanned whole, show the index the
+                # planner would use on a real table.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor)
+            may_sort = name in (
+                'recipes-list-tags',
+                'recipes-list-favorited',
+                'recipes-list-cart'
+            )
+            if (
+                f'Seq Scan on {self.recipes_table}' in plan
+                or not may_sort and 'Sort' in plan
+            ):
+                reports.append(f'{url} is not read through an index:\n{plan}')
+        return reports
+
+    def handle(self, *args, **options):
+        # Everything written while measuring is thrown away afterwards,
+        # the cache included.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            SHOPPING_LIST_ROOT=media_root,
+            CACHES=BUDGET_CACHES
+        ), transaction.atomic():
+            self.prepare()
+            flows = self.get_flows()
+            results = self.measure(
+                flows, options['iterations'], options['warmup']
+            )
+            if options['check_plans']:
+                self.recipes_table = connection.ops.quote_name(
+                    Recipes._meta.db_table
+                )
+                plan_reports = self.check_plans(flows)
+            transaction.set_rollback(True)
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:28} p50 {result["p50_ms"]:8.2f} ms  '
+                f'p90 {result["p90_ms"]:8.2f} ms  '
+                f'p99 {result["p99_ms"]:8.2f} ms  '
+                f'{result["queries"]:3} queries  '
+                f'{result["peak_memory_kb"]:6} KiB'
+            )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+        if options['check_budgets']:
+            reports = self.check_budgets(flows)
+            if reports:
+                raise CommandError('\n'.join(reports))
+            self.stdout.write(self.style.SUCCESS('All queries within budget'))
+        if options['check_plans']:
+            if plan_reports:
+                raise CommandError('\n'.join(plan_reports))
+            self.stdout.write(self.style.SUCCESS(
+                'All recipe lists read through an index'
+            ))
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+            regressions = self.compare(
+                results, baseline, options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Regressions against the baseline:\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('No regressions'))
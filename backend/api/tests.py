@@ -0,0 +1,926 @@
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+import brotli
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.v1 import shopping_list
+from api.v1.filters import ORDERINGS
+from foodgram.cache import get_version
+from foodgram.query_budget import BUDGET_CACHES, endpoint_query_budget
+from recipes import cart_totals, popularity
+from recipes.models import (
+    Favorite,
+    Ingredients,
+    IngredientsInRecipes,
+    Recipes,
+    ShoppingCart,
+    ShoppingCartTotals,
+    Tags
+)
+from users.models import FoodgramUser, Subscriptions
+
+# Pages are requested with PAGE_SIZE and twice as many items, both have
+# to fit the same budget.
+PAGE_SIZE = 3
+MISSING_ID = 10 ** 9
+MEDIA_ROOT = tempfile.mkdtemp()
+SHOPPING_LIST_ROOT = tempfile.mkdtemp()
+
+
+def get_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), '#E26C2D').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(
+    CACHES=BUDGET_CACHES,
+    MEDIA_ROOT=MEDIA_ROOT,
+    SHOPPING_LIST_ROOT=SHOPPING_LIST_ROOT
+)
+class APITestCase(TestCase):
+    """Test case with its own in-process cache and file storage."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(SHOPPING_LIST_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+
+class QueryBudgetTests(APITestCase):
+    """Every API action stays within its query budget at any page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tags.objects.create(
+                name=f'Tag {number}',
+                color=f'#00000{number}',
+                slug=f'tag-{number}'
+            )
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredients.objects.create(
+                name=f'Ingredient {number}', measurement_unit='g'
+            )
+            for number in range(3)
+        ]
+        cls.authors = [
+            cls.create_user(f'author{number}')
+            for number in range(2 * PAGE_SIZE)
+        ]
+        cls.recipes = []
+        for number in range(4 * PAGE_SIZE):
+            recipe = Recipes.objects.create(
+                name=f'Recipe {number:02}',
+                text='Text',
+                image='recipes/images/recipe.png',
+                author=cls.authors[number % len(cls.authors)],
+                cooking_time=10 + number,
+            )
+            recipe.tags.set(cls.tags)
+            for ingredient in cls.ingredients:
+                IngredientsInRecipes.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+            cls.recipes.append(recipe)
+        cls.readers = {}
+        for size in (PAGE_SIZE, 2 * PAGE_SIZE):
+            reader = cls.create_user(f'reader{size}')
+            for recipe in cls.recipes[:size]:
+                Favorite.objects.create(user=reader, recipe=recipe)
+                ShoppingCart.objects.create(user=reader, recipe=recipe)
+            for author in cls.authors[:size]:
+                Subscriptions.objects.create(
+                    subscriber=reader, followed_user=author
+                )
+            cls.readers[size] = reader
+
+    @classmethod
+    def create_user(cls, username):
+        return FoodgramUser.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            first_name='First',
+            last_name='Last',
+            password='Secret-password-1',
+        )
+
+    def get_client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def request(self, client, method, url, data=None):
+        with endpoint_query_budget(url, method):
+            response = getattr(client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(
+            response.status_code, 400, getattr(response, 'data', None)
+        )
+        return response
+
+    def get_recipe_payload(self):
+        return {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in self.ingredients
+            ],
+            'tags': [tag.id for tag in self.tags],
+            'image': get_image(),
+            'name': 'New recipe',
+            'text': 'Text',
+            'cooking_time': 15,
+        }
+
+    def test_paginated_lists(self):
+        for size, reader in self.readers.items():
+            client = self.get_client(reader)
+            for url in (
+                f'/api/recipes/?limit={size}',
+                f'/api/recipes/?limit={size}&is_favorited=1',
+                f'/api/recipes/?limit={size}&is_in_shopping_cart=1',
+                f'/api/recipes/?limit={size}&tags=tag-0&tags=tag-1',
+                f'/api/recipes/?limit={size}&ordering=popular',
+                f'/api/recipes/?limit={size}&pagination=cursor'
+                '&ordering=newest',
+                f'/api/users/subscriptions/?limit={size}',
+                f'/api/users/subscriptions/?limit={size}&recipes_limit=1',
+            ):
+                with self.subTest(url=url):
+                    response = self.request(client, 'get', url)
+                    self.assertEqual(len(response.data['results']), size)
+            # Users only see themselves in the list (djoser HIDE_USERS).
+            self.request(client, 'get', f'/api/users/?limit={size}')
+            self.request(
+                self.get_client(), 'get', f'/api/recipes/?limit={size}'
+            )
+
+    def test_details(self):
+        client = self.get_client(self.readers[PAGE_SIZE])
+        recipe = self.recipes[0]
+        self.request(client, 'get', f'/api/recipes/{recipe.id}/')
+        self.request(client, 'get', f'/api/users/{self.authors[0].id}/')
+        self.request(client, 'get', '/api/users/me/')
+        self.request(client, 'get', '/api/tags/')
+        self.request(client, 'get', f'/api/tags/{self.tags[0].id}/')
+        self.request(client, 'get', '/api/ingredients/')
+        self.request(client, 'get', '/api/ingredients/?name=Ingr')
+        self.request(
+            client, 'get', f'/api/ingredients/{self.ingredients[0].id}/'
+        )
+
+    def test_shopping_lists(self):
+        for reader in self.readers.values():
+            client = self.get_client(reader)
+            self.request(client, 'get', '/api/recipes/shopping_list/')
+            for export_format in ('pdf', 'txt', 'csv', 'json'):
+                self.request(
+                    client,
+                    'get',
+                    '/api/recipes/download_shopping_cart/'
+                    f'?format={export_format}'
+                )
+
+    def test_shopping_list_pdf_is_replaced(self):
+        reader = self.readers[PAGE_SIZE]
+        client = self.get_client(reader)
+        url = '/api/recipes/download_shopping_cart/?format=pdf'
+        directory = os.path.join(SHOPPING_LIST_ROOT, str(reader.pk))
+        self.request(client, 'get', url)
+        first = os.listdir(directory)
+        ShoppingCart.objects.filter(user=reader).first().delete()
+        self.request(client, 'get', url)
+        second = os.listdir(directory)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first, second)
+        self.assertNotIn('shopping_lists', os.listdir(MEDIA_ROOT))
+
+    def test_concurrent_shopping_list_pdfs(self):
+        reader = self.readers[2 * PAGE_SIZE]
+        directory = os.path.join(SHOPPING_LIST_ROOT, str(reader.pk))
+        render_pdf = shopping_list.render_pdf
+        newer = []
+
+        def render_while_cart_changes(rows, file):
+            # Another download renders the changed cart meanwhile.
+            render_pdf(rows, file)
+            if render.call_count == 1:
+                ShoppingCart.objects.filter(user=reader).first().delete()
+                newer.append(shopping_list.get_shopping_list_pdf(reader))
+
+        with mock.patch.object(
+            shopping_list, 'render_pdf', side_effect=render_while_cart_changes
+        ) as render:
+            older = shopping_list.get_shopping_list_pdf(reader)
+        for pdf in (older, newer[0]):
+            with pdf:
+                self.assertTrue(pdf.read().startswith(b'%PDF'))
+        files = os.listdir(directory)
+        self.assertLessEqual(len(files), 2)
+        self.assertTrue(all(name.endswith('.pdf') for name in files))
+
+    def test_export_format_ignores_accept(self):
+        client = self.get_client(self.readers[PAGE_SIZE])
+        url = '/api/recipes/download_shopping_cart/'
+        for accept, export_format, content_type in (
+            ('application/json', None, 'application/pdf'),
+            ('*/*', None, 'application/pdf'),
+            ('application/json', 'csv', 'text/csv; charset=utf-8'),
+            ('application/pdf', 'json', 'application/json'),
+        ):
+            with self.subTest(accept=accept, export_format=export_format):
+                response = client.get(
+                    url,
+                    {'format': export_format} if export_format else {},
+                    HTTP_ACCEPT=accept
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], content_type)
+
+    def test_export_errors_are_json(self):
+        for export_format in ('pdf', 'txt', 'csv'):
+            with self.subTest(export_format=export_format):
+                response = self.get_client().get(
+                    '/api/recipes/download_shopping_cart/'
+                    f'?format={export_format}'
+                )
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(
+                    response['Content-Type'], 'application/json'
+                )
+
+    def test_recipe_writes(self):
+        author = self.authors[0]
+        client = self.get_client(author)
+        response = self.request(
+            client, 'post', '/api/recipes/', self.get_recipe_payload()
+        )
+        url = f'/api/recipes/{response.data["id"]}/'
+        self.request(client, 'patch', url, self.get_recipe_payload())
+        self.request(client, 'put', url, self.get_recipe_payload())
+        self.request(client, 'delete', url)
+
+    def test_toggles(self):
+        reader = self.create_user('toggler')
+        client = self.get_client(reader)
+        recipe = self.recipes[-1]
+        author = self.authors[-1]
+        for url in (
+            f'/api/recipes/{recipe.id}/favorite/',
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+            f'/api/users/{author.id}/subscribe/',
+        ):
+            with self.subTest(url=url):
+                response = self.request(client, 'post', url)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(client.post(url).status_code, 400)
+                response = self.request(client, 'delete', url)
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(client.delete(url).status_code, 400)
+        for url in (
+            f'/api/recipes/{MISSING_ID}/favorite/',
+            f'/api/recipes/{MISSING_ID}/shopping_cart/',
+            f'/api/users/{MISSING_ID}/subscribe/',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(client.delete(url).status_code, 404)
+        response = client.post(f'/api/users/{reader.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_toggles(self):
+        reader = self.create_user('toggler')
+        client = self.get_client(reader)
+        for size in (PAGE_SIZE, 2 * PAGE_SIZE):
+            recipe_ids = [recipe.id for recipe in self.recipes[-size:]]
+            author_ids = [author.id for author in self.authors[-size:]]
+            for url, ids in (
+                ('/api/recipes/favorite/batch/', recipe_ids),
+                ('/api/recipes/shopping_cart/batch/', recipe_ids),
+                ('/api/users/subscribe/batch/', author_ids),
+            ):
+                for method, statuses in (
+                    ('post', (201, 400)),
+                    ('delete', (204, 400)),
+                ):
+                    for expected in statuses:
+                        with self.subTest(url=url, size=size, method=method):
+                            response = self.request(
+                                client, method, url, {'ids': ids}
+                            )
+                            self.assertEqual(
+                                [item['status'] for item in response.data],
+                                [expected] * size
+                            )
+        response = self.request(
+            client,
+            'post',
+            '/api/users/subscribe/batch/',
+            {'ids': [self.authors[0].id, reader.id, MISSING_ID]}
+        )
+        self.assertEqual(
+            [(item['id'], item['status']) for item in response.data],
+            [(self.authors[0].id, 201), (reader.id, 400), (MISSING_ID, 404)]
+        )
+
+    def test_batch_rejects_ids_out_of_range(self):
+        client = self.get_client(self.readers[PAGE_SIZE])
+        for ids in ([0], [2 ** 63]):
+            with self.subTest(ids=ids):
+                response = client.post(
+                    '/api/recipes/favorite/batch/', {'ids': ids},
+                    format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_account(self):
+        self.request(self.get_client(), 'post', '/api/users/', {
+            'username': 'newcomer',
+            'email': 'newcomer@example.com',
+            'first_name': 'First',
+            'last_name': 'Last',
+            'password': 'Secret-password-2',
+        })
+        self.request(
+            self.get_client(self.authors[0]),
+            'post',
+            '/api/users/set_password/',
+            {
+                'current_password': 'Secret-password-1',
+                'new_password': 'Secret-password-3',
+            }
+        )
+
+
+class CursorPaginationTests(APITestCase):
+    """Cursors walk every ordering completely, across ties."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = FoodgramUser.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='Secret-password-1',
+        )
+        Recipes.objects.bulk_create(
+            Recipes(
+                name=f'Recipe {number:02}',
+                text='Text',
+                image='recipes/images/recipe.png',
+                author=author,
+                cooking_time=10 + number % 3,
+                popularity=number % 2,
+            )
+            for number in range(4 * PAGE_SIZE + 1)
+        )
+        # Rows created before created_at existed share one timestamp.
+        Recipes.objects.update(created_at=timezone.now())
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            last_url, url = url, response.data[link]
+        return ids, last_url
+
+    def test_orderings(self):
+        for ordering, fields in ORDERINGS.items():
+            with self.subTest(ordering=ordering):
+                expected = list(Recipes.objects.order_by(
+                    *fields
+                ).values_list('id', flat=True))
+                ids, last_url = self.walk(
+                    f'/api/recipes/?pagination=cursor&limit={PAGE_SIZE}'
+                    f'&ordering={ordering}',
+                    'next'
+                )
+                self.assertEqual(ids, expected)
+                ids, _ = self.walk(last_url, 'previous')
+                pages = [
+                    expected[start:start + PAGE_SIZE]
+                    for start in range(0, len(expected), PAGE_SIZE)
+                ]
+                self.assertEqual(ids, sum(reversed(pages), []))
+
+    def test_invalid_cursor(self):
+        for cursor in ('bogus', 'eyJwIjogWyJ4Il19', 'W10='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    f'/api/recipes/?cursor={cursor}&ordering=newest'
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class ListPlanTests(APITestCase):
+    """Recipe lists are read in list order from an index, never sorted."""
+
+    # Query string of the list and the index its page must be read from.
+    PLANS = (
+        ('', 'recipes_name_idx'),
+        ('ordering=newest', 'recipes_created_idx'),
+        ('ordering=cooking_time', 'recipes_cooking_time_idx'),
+        ('ordering=popular', 'recipes_popularity_idx'),
+        ('author={author}', 'recipes_author_name_idx'),
+        ('author={author}&ordering=newest', 'recipes_author_created_idx'),
+        ('pagination=cursor', 'recipes_recipes_pkey'),
+        ('pagination=cursor&ordering=newest', 'recipes_created_idx'),
+        ('pagination=cursor&ordering=popular', 'recipes_popularity_idx'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = FoodgramUser.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='Secret-password-1',
+        )
+        Recipes.objects.bulk_create(
+            Recipes(
+                name=f'Recipe {number:02}',
+                text='Text',
+                image='recipes/images/recipe.png',
+                author=cls.author,
+                cooking_time=10 + number,
+            )
+            for number in range(2 * PAGE_SIZE)
+        )
+
+    def get_page_query(self, url):
+        table = connection.ops.quote_name(Recipes._meta.db_table)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if sql.startswith(f'SELECT {table}.') and ' LIMIT ' in sql:
+                return sql, response
+        self.fail(f'{url} read no recipe page')
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            # The tables are tiny, make the planner show the index it
+            # would use on a real one.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor)
+
+    def test_plans(self):
+        for query, index in self.PLANS:
+            url = '/api/recipes/?limit=2&' + query.format(
+                author=self.author.pk
+            )
+            with self.subTest(url=url):
+                sql, response = self.get_page_query(url)
+                plan = self.get_plan(sql)
+                self.assertIn(f' using {index} on ', plan)
+                self.assertNotIn('Sort', plan)
+                if 'cursor' not in query:
+                    continue
+                sql, _ = self.get_page_query(response.data['next'])
+                plan = self.get_plan(sql)
+                self.assertIn(f' using {index} on ', plan)
+                self.assertIn('Index Cond', plan)
+                self.assertNotIn('Sort', plan)
+
+
+class VersionTests(APITestCase):
+    """Writes outside the API change the validators of what they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = FoodgramUser.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            first_name='First',
+            last_name='Last',
+            password='Secret-password-1',
+        )
+        cls.ingredient = Ingredients.objects.create(
+            name='Ingredient', measurement_unit='g'
+        )
+        cls.tag = Tags.objects.create(
+            name='Tag', color='#000000', slug='tag'
+        )
+        cls.recipes = [
+            Recipes.objects.create(
+                name=f'Recipe {number}',
+                text='Text',
+                image='recipes/images/recipe.png',
+                author=cls.admin,
+                cooking_time=10,
+            )
+            for number in range(2)
+        ]
+        Recipes.objects.update(updated_at=timezone.now() - timedelta(1))
+        for recipe in cls.recipes:
+            recipe.refresh_from_db()
+
+    def assertTouched(self, *recipes):
+        for recipe in recipes:
+            old = recipe.updated_at
+            recipe.refresh_from_db()
+            self.assertGreater(recipe.updated_at, old)
+
+    def test_admin_touches_recipes(self):
+        self.client.force_login(self.admin)
+        first, second = self.recipes
+        url = '/admin/recipes/ingredientsinrecipes/'
+        self.client.post(f'{url}add/', {
+            'ingredient': self.ingredient.pk, 'recipe': first.pk, 'amount': 1
+        })
+        self.assertTouched(first)
+        row = IngredientsInRecipes.objects.get()
+        self.client.post(f'{url}{row.pk}/change/', {
+            'ingredient': self.ingredient.pk, 'recipe': second.pk, 'amount': 1
+        })
+        self.assertTouched(first, second)
+        self.client.post(f'{url}{row.pk}/delete/', {'post': 'yes'})
+        self.assertFalse(IngredientsInRecipes.objects.exists())
+        self.assertTouched(second)
+        url = '/admin/recipes/tagsrecipes/'
+        self.client.post(f'{url}add/', {
+            'tag': self.tag.pk, 'recipe': first.pk
+        })
+        self.assertTouched(first)
+
+    def test_last_modified_skips_the_current_second(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.id}/'
+        self.client.get(url)
+        with mock.patch(
+            'api.v1.conditional.time.time', return_value=time.time() + 2
+        ):
+            last_modified = self.client.get(url)['Last-Modified']
+            self.assertEqual(self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified
+            ).status_code, 304)
+        recipe.name = 'Renamed'
+        recipe.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_revalidation_reads_versions_at_once(self):
+        url = '/api/recipes/?limit=2'
+        etag = self.client.get(url)['ETag']
+        with mock.patch('foodgram.cache.cache', wraps=cache) as spy:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(spy.get_many.call_count, 1)
+        spy.get_or_set.assert_not_called()
+
+    def test_count_version_changes_on_commit(self):
+        label = Recipes._meta.label_lower
+        version = get_version('count', label)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.admin, recipe=self.recipes[0])
+            self.assertEqual(get_version('count', label), version)
+        self.assertGreater(get_version('count', label), version)
+
+    def test_users_version_follows_shown_fields(self):
+        with mock.patch('users.signals.bump_version_on_commit') as bump:
+            user = FoodgramUser.objects.create_user(
+                username='user',
+                email='user@example.com',
+                password='Secret-password-1',
+            )
+            user.set_password('Secret-password-2')
+            user.save()
+            user = FoodgramUser.objects.get(pk=user.pk)
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+            bump.assert_not_called()
+            user.first_name = 'First'
+            user.save()
+            bump.assert_called_once_with('users')
+
+
+class CartTotalsTests(APITestCase):
+    """Cart totals follow the recipes and users they are computed from."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = [
+            FoodgramUser.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                password='Secret-password-1',
+            )
+            for username in ('author', 'reader')
+        ]
+        cls.tag = Tags.objects.create(name='Tag', color='#000000', slug='tag')
+        cls.salt, cls.flour = [
+            Ingredients.objects.create(name=name, measurement_unit='g')
+            for name in ('salt', 'flour')
+        ]
+        cls.recipes = []
+        for amounts in ({cls.salt: 10, cls.flour: 20}, {cls.salt: 5}):
+            recipe = Recipes.objects.create(
+                name=f'Recipe {len(cls.recipes)}',
+                text='Text',
+                image='recipes/images/recipe.png',
+                author=cls.author,
+                cooking_time=10,
+            )
+            for ingredient, amount in amounts.items():
+                IngredientsInRecipes.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+            cls.recipes.append(recipe)
+        ShoppingCart.objects.create(user=cls.author, recipe=cls.recipes[0])
+
+    def get_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def get_totals(self, user):
+        return dict(
+            user.cart_totals.values_list('ingredient__name', 'amount')
+        )
+
+    def patch_salt(self, amount):
+        response = self.get_client(self.author).patch(
+            f'/api/recipes/{self.recipes[0].id}/',
+            {
+                'ingredients': [{'id': self.salt.id, 'amount': amount}],
+                'tags': [self.tag.id],
+                'image': get_image(),
+                'name': 'Recipe 0',
+                'text': 'Text',
+                'cooking_time': 10,
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_ingredients_change(self):
+        self.patch_salt(1)
+        self.assertEqual(cart_totals.count_differences(), 0)
+        self.assertEqual(self.get_totals(self.reader), {'salt': 6})
+        self.assertEqual(self.get_totals(self.author), {'salt': 1})
+
+    def test_shopping_list_follows_ingredients(self):
+        client = self.get_client(self.reader)
+        etag = client.get('/api/recipes/shopping_list/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patch_salt(1)
+        response = client.get(
+            '/api/recipes/shopping_list/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['name'], item['amount']) for item in response.data],
+            [('salt', 6)]
+        )
+
+    def test_recipe_deletion(self):
+        response = self.get_client(self.author).delete(
+            f'/api/recipes/{self.recipes[1].id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(cart_totals.count_differences(), 0)
+        self.assertEqual(
+            self.get_totals(self.reader), {'salt': 10, 'flour': 20}
+        )
+
+    def test_user_deletion(self):
+        self.reader.delete()
+        self.assertEqual(cart_totals.count_differences(), 0)
+        self.assertEqual(
+            self.get_totals(self.author), {'salt': 10, 'flour': 20}
+        )
+        self.author.delete()
+        self.assertEqual(cart_totals.count_differences(), 0)
+        self.assertFalse(ShoppingCartTotals.objects.exists())
+
+
+class CounterTests(APITestCase):
+    """Counter and popularity columns follow toggles and batches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = [
+            FoodgramUser.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                password='Secret-password-1',
+            )
+            for username in ('author', 'reader')
+        ]
+        cls.recipes = [
+            Recipes.objects.create(
+                name=f'Recipe {number}',
+                text='Text',
+                image='recipes/images/recipe.png',
+                author=cls.author,
+                cooking_time=10,
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def assertCounters(self, favorites, in_carts, followers):
+        self.assertEqual(
+            [
+                (recipe.favorites_count, recipe.in_carts_count)
+                for recipe in Recipes.objects.order_by('id')
+            ],
+            list(zip(favorites, in_carts))
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, followers)
+        self.assertEqual(self.author.recipes_count, len(self.recipes))
+
+    def test_toggles(self):
+        recipe = self.recipes[0]
+        urls = (
+            f'/api/recipes/{recipe.id}/favorite/',
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+            f'/api/users/{self.author.id}/subscribe/',
+        )
+        for url in urls:
+            self.client.post(url)
+            self.client.post(url)
+        self.assertCounters([1, 0, 0], [1, 0, 0], 1)
+        for url in urls:
+            self.client.delete(url)
+            self.client.delete(url)
+        self.assertCounters([0, 0, 0], [0, 0, 0], 0)
+
+    def test_batches(self):
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        requests = (
+            ('/api/recipes/favorite/batch/', recipe_ids[:2]),
+            ('/api/recipes/shopping_cart/batch/', recipe_ids),
+            ('/api/users/subscribe/batch/', [self.author.id, self.reader.id]),
+        )
+        for url, ids in requests:
+            self.client.post(url, {'ids': ids}, format='json')
+            self.client.post(url, {'ids': ids}, format='json')
+        self.assertCounters([1, 1, 0], [1, 1, 1], 1)
+        for url, ids in requests:
+            self.client.delete(url, {'ids': ids[:1]}, format='json')
+        self.assertCounters([0, 1, 0], [0, 1, 1], 0)
+
+    def test_subscribe_shows_the_new_follower(self):
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['followers_count'], 1)
+
+    def test_popularity_update(self):
+        first, second, third = self.recipes
+        self.client.post(f'/api/recipes/{second.id}/favorite/')
+        self.client.post(f'/api/recipes/{first.id}/shopping_cart/')
+        self.assertEqual(
+            set(Recipes.objects.filter(popularity_stale=True)),
+            {first, second}
+        )
+        self.assertEqual(popularity.update(batch_size=1), 2)
+        self.assertFalse(Recipes.objects.filter(popularity_stale=True))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertAlmostEqual(first.popularity / second.popularity, 2, 3)
+        response = self.client.get('/api/recipes/?ordering=popular')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [first.id, second.id, third.id]
+        )
+        self.assertEqual(popularity.update(), 0)
+        self.assertEqual(popularity.update(batch_size=2, full=True), 3)
+
+
+class IngredientTests(APITestCase):
+    """Ingredient search and the full catalog."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in (
+            'Мёд',
+            'Медовик',
+            'Морская соль',
+            'Соль',
+            'соль крупная',
+        ):
+            Ingredients.objects.create(name=name, measurement_unit='г')
+
+    def search(self, query):
+        response = self.client.get(f'/api/ingredients/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_search(self):
+        for query, names in (
+            ('name=мед', ['Мёд', 'Медовик']),
+            ('name=МЁД', ['Мёд', 'Медовик']),
+            ('name=СОЛЬ', ['Соль', 'соль крупная', 'Морская соль']),
+            ('name=соль&limit=2', ['Соль', 'соль крупная']),
+            ('name=соль&limit=0', []),
+            ('name=крупная', ['соль крупная']),
+            ('name=перец', []),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), names)
+
+    def test_catalog_encodings(self):
+        content = None
+        for accept_encoding, encoding, decompress in (
+            ('', None, bytes),
+            ('gzip, deflate', 'gzip', gzip.decompress),
+            ('gzip, br', 'br', brotli.decompress),
+            ('br;q=0, gzip', 'gzip', gzip.decompress),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get(
+                    '/api/ingredients/',
+                    HTTP_ACCEPT_ENCODING=accept_encoding
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                content = content or decompress(response.content)
+                self.assertEqual(decompress(response.content), content)
+        self.assertCountEqual(
+            [ingredient['name'] for ingredient in json.loads(content)],
+            ['Мёд', 'Медовик', 'Морская соль', 'Соль', 'соль крупная']
+        )
+
+    def test_catalog_revalidation(self):
+        response = self.client.get(
+            '/api/ingredients/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        etag = response['ETag']
+        response = self.client.get(
+            '/api/ingredients/',
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredients.objects.create(name='Перец', measurement_unit='г')
+        response = self.client.get(
+            '/api/ingredients/',
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TagsTests(APITestCase):
+    """The cached tags list."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tags.objects.create(
+            name='Breakfast', color='#000000', slug='breakfast'
+        )
+
+    def test_etag_follows_tags(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.tag.name = 'Lunch'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(
+            [tag['name'] for tag in response.data], ['Lunch']
+        )
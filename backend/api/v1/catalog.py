@@ -0,0 +1,139 @@
+import bisect
+import gzip
+import hashlib
+import json
+
+import brotli
+from django.db import DatabaseError
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags
+
+from foodgram.cache import get_version
+from recipes.models import Ingredients
+
+_catalogs = {}
+
+
+def normalize(text):
+    """Fold case and treat ё as е so searches match what people type."""
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientCatalog:
+    """In-memory snapshot of the ingredient catalog with a prefix index."""
+
+    def __init__(self, version, ingredients):
+        self.version = version
+        self.ingredients = ingredients
+        self.index = sorted(
+            (normalize(ingredient['name']), position)
+            for position, ingredient in enumerate(ingredients)
+        )
+        self.keys = [key for key, _ in self.index]
+
+    def search(self, query, limit=None):
+        """
+        Return ingredients whose name starts with the query, followed
+        by those that only contain it.
+        """
+        query = normalize(query)
+        start = bisect.bisect_left(self.keys, query)
+        positions = []
+        for key, position in self.index[start:]:
+            if not key.startswith(query):
+                break
+            positions.append(position)
+        if limit is None or len(positions) < limit:
+            prefixed = set(positions)
+            positions += [
+                position for key, position in self.index
+                if query in key and position not in prefixed
+            ]
+        return [self.ingredients[position] for position in positions[:limit]]
+
+    @cached_property
+    def representations(self):
+        """Serialized catalog, once per content encoding."""
+        content = json.dumps(
+            self.ingredients,
+            ensure_ascii=False,
+            separators=(',', ':')
+        ).encode()
+        return {
+            'identity': content,
+            'gzip': gzip.compress(content),
+            'br': brotli.compress(content),
+        }
+
+    @cached_property
+    def etags(self):
+        digest = hashlib.sha256(self.representations['identity']).hexdigest()
+        return {
+            encoding: (
+                f'"{digest}"' if encoding == 'identity'
+                else f'"{digest}-{encoding}"'
+            )
+            for encoding in self.representations
+        }
+
+
+def get_catalog():
+    """Return the catalog snapshot for the current ingredient version."""
+    version = get_version('ingredients')
+    catalog = _catalogs.get('current')
+    if catalog is None or catalog.version != version:
+        catalog = IngredientCatalog(
+            version,
+            list(Ingredients.objects.values('id', 'name', 'measurement_unit'))
+        )
+        _catalogs['current'] = catalog
+    return catalog
+
+
+def get_accepted_encodings(request):
+    encodings = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00'):
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def catalog_response(request, catalog):
+    """
+    Serve the whole catalog from its precompressed representations,
+    answering a matching If-None-Match with 304.
+    """
+    accepted = get_accepted_encodings(request)
+    encoding = next(
+        (
+            encoding for encoding in ('br', 'gzip')
+            if encoding in accepted
+        ),
+        'identity'
+    )
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in if_none_match or set(if_none_match) & set(
+        catalog.etags.values()
+    ):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            catalog.representations[encoding],
+            content_type='application/json'
+        )
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = catalog.etags[encoding]
+    response['Cache-Control'] = 'public, no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def warm_up():
+    """Build the catalog when a worker starts, if the database is ready."""
+    try:
+        get_catalog().etags
+    except DatabaseError:
+        pass
@@ -0,0 +1,71 @@
+"""
+Validators for conditional GET of recipes. They are computed from the
+version columns of the recipe rows and from cache versions, so a
+revalidation costs one small query and no serialization.
+"""
+import hashlib
+import time
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+from foodgram.cache import get_versions
+from recipes.models import Recipes
+
+# Columns that change with the representation of the recipe itself.
+VERSION_FIELDS = ('id', 'updated_at', 'favorites_count')
+
+
+def get_namespaces(user):
+    """
+    Cache namespaces of everything recipe responses show besides the
+    recipe rows: tags, ingredients, authors and the user's favorites,
+    cart and subscriptions.
+    """
+    namespaces = [('tags',), ('ingredients',), ('users',)]
+    if user.is_authenticated:
+        namespaces.append(('recipe_state', user.pk))
+    return namespaces
+
+
+def get_validators(request, rows, extra=()):
+    """
+    ETag and Last-Modified timestamp of a response showing the recipe
+    rows, tuples of VERSION_FIELDS, with extra data such as page links.
+
+    The counters of a recipe change without its updated_at, so the
+    Last-Modified date also follows the recipe count version, bumped by
+    any write to recipes, favorites or carts. The ETag stays exact.
+    HTTP dates have whole seconds, so there is no Last-Modified while
+    the last change is in the current second: a later change in the
+    same second would carry the same date.
+    """
+    *versions, count_version = get_versions(
+        *get_namespaces(request.user),
+        ('count', Recipes._meta.label_lower)
+    )
+    signature = repr((
+        request.user.pk,
+        request.accepted_renderer.format,
+        versions,
+        rows,
+        extra,
+    ))
+    etag = f'"recipes-{hashlib.md5(signature.encode()).hexdigest()}"'
+    last_modified = int(max(
+        [updated_at.timestamp() for _, updated_at, _ in rows]
+        + versions
+        + [count_version]
+    ))
+    if last_modified >= int(time.time()):
+        return etag, None
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -1,20 +1,75 @@
+from django.db.models import Exists, OuterRef
+from django_filters import fields
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipes, Ingredients
+from foodgram.cache import get_version
+from recipes.models import Recipes, Tags, TagsRecipes
+
+_tags_cache = {}
+
+ORDERINGS = {
+    'popular': ('-popularity', '-id'),
+    'newest': ('-created_at', '-id'),
+    'cooking_time': ('cooking_time', 'id'),
+}
+
+
+def get_tag_ids():
+    """Return tag ids by slug, cached in the process until tags change."""
+    version = get_version('tags')
+    if _tags_cache.get('version') != version:
+        _tags_cache['ids'] = dict(Tags.objects.values_list('slug', 'id'))
+        _tags_cache['version'] = version
+    return _tags_cache['ids']
+
+
+class TagSlugsField(fields.MultipleChoiceField):
+    """
+    Tag slugs, checked against the tags only when some are given, so
+    that other lists do not read the tags version.
+    """
+
+    def valid_value(self, value):
+        return value in get_tag_ids()
+
+
+class TagSlugsFilter(filters.MultipleChoiceFilter):
+    field_class = TagSlugsField
 
 
 class RecipeFilter(filters.FilterSet):
     """Filter for recipes."""
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagSlugsFilter(method='get_tags')
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
     author = filters.CharFilter(field_name='author__id')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipes
-        fields = ['tags', 'is_favorited', 'is_in_shopping_cart', 'author']
+        fields = [
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'author',
+            'ordering'
+        ]
+
+    def get_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return queryset.filter(
+            Exists(
+                TagsRecipes.objects.filter(
+                    recipe=OuterRef('pk'),
+                    tag__in=[tag_ids[slug] for slug in value]
+                )
+            )
+        )
 
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -26,11 +81,5 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
-
-class IngredientFilter(filters.FilterSet):
-    """Filter for ingredients."""
-    name = filters.CharFilter(field_name='name', lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredients
-        fields = ['name']
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
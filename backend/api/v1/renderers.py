@@ -0,0 +1,48 @@
+from rest_framework import renderers
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class ExportRenderer(renderers.JSONRenderer):
+    """
+    Renderer of a shopping list export format. It only takes part in
+    content negotiation: the view streams the export itself, so just
+    error details are rendered, as JSON and labelled so.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = renderers.JSONRenderer.media_type
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class PDFRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+class TextRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ExportNegotiation(DefaultContentNegotiation):
+    """
+    Choose the export from ?format= only, whatever the Accept header
+    says: HTTP clients send application/json by default. Without a
+    format the download is the first renderer, the PDF. Unknown formats
+    answer 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        export_format = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        if export_format:
+            renderers = self.filter_renderers(renderers, export_format)
+        return renderers[0], renderers[0].media_type
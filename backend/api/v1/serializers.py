@@ -1,5 +1,8 @@
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.settings import api_settings
 
 from users.models import FoodgramUser, Subscriptions
 from recipes.models import (
@@ -11,9 +14,14 @@ from recipes.models import (
     ShoppingCart
 )
 from foodgram import constants
+from recipes.cart_totals import changing_recipes
+from foodgram.metrics import TimedSerializerMixin
 
 
-class FoodgramUserSerializer(serializers.ModelSerializer):
+class FoodgramUserSerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Serializer for user."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -29,6 +37,8 @@ class FoodgramUserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return bool(
             request
@@ -40,42 +50,64 @@ class FoodgramUserSerializer(serializers.ModelSerializer):
         )
 
 
+def get_recipes_limit(request):
+    """The recipes_limit query parameter, None if absent or invalid."""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return limit if limit >= 0 else None
+
+
 class SubscribeWriteSerializer(serializers.ModelSerializer):
-    """Serializer for creating subscriptions."""
+    """
+    Serializer for creating subscriptions. Both the subscription and its
+    removal run as a single statement, ids are not looked up beforehand.
+    """
+    subscriber = serializers.IntegerField()
+    followed_user = serializers.IntegerField()
+    self_subscription = 'You cannot subscribe to yourself'
+    already_added = 'You have already subscribed to this user'
+    not_added = 'You have not subscribed to this user'
+
     class Meta:
         model = Subscriptions
         fields = ('subscriber', 'followed_user')
 
     def validate(self, data):
         if data['subscriber'] == data['followed_user']:
-            raise serializers.ValidationError(
-                'You cannot subscribe to yourself'
-            )
-        subscription = Subscriptions.objects.filter(
-            subscriber=data['subscriber'],
-            followed_user=data['followed_user']
-        ).exists()
-        if self.context.get('request').method == 'POST':
-            if subscription:
-                raise serializers.ValidationError(
-                    'You have already subscribed to this user'
-                )
-        if self.context.get('request').method == 'DELETE':
-            if not subscription:
-                raise serializers.ValidationError(
-                    'You have not subscribed to this user'
-                )
+            raise serializers.ValidationError(self.self_subscription)
         return data
 
+    def create(self, validated_data):
+        followed_user = Subscriptions.objects.add(
+            validated_data['subscriber'], validated_data['followed_user']
+        )
+        if followed_user is None:
+            raise NotFound()
+        if not followed_user.created:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [self.already_added]
+            })
+        # The row was read before the new subscription was counted.
+        followed_user.refresh_from_db(fields=['followers_count'])
+        return followed_user
+
     def destroy(self):
-        return Subscriptions.objects.filter(
-            subscriber=self.validated_data.get('subscriber'),
-            followed_user=self.validated_data.get('followed_user')
-        ).delete()
+        exists, removed = Subscriptions.objects.remove(
+            self.validated_data['subscriber'],
+            self.validated_data['followed_user']
+        )
+        if not exists:
+            raise NotFound()
+        if not removed:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [self.not_added]
+            })
 
     def to_representation(self, instance):
         return SubscribeSerializer(
-            instance.followed_user,
+            instance,
             context={'request': self.context.get('request')}
         ).data
 
@@ -83,30 +115,27 @@ class SubscribeWriteSerializer(serializers.ModelSerializer):
 class SubscribeSerializer(FoodgramUserSerializer):
     """Serializer for subscriptions."""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(FoodgramUserSerializer.Meta):
         model = FoodgramUser
         fields = FoodgramUserSerializer.Meta.fields + (
             'recipes',
-            'recipes_count'
+            'recipes_count',
+            'followers_count'
         )
 
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()
-        pararms = self.context['request'].query_params
-        if 'recipes_limit' in pararms:
-            try:
-                recipes = recipes[:int(pararms['recipes_limit'])]
-            except ValueError:
-                pass
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = obj.recipes.all()
+            limit = get_recipes_limit(self.context['request'])
+            if limit is not None:
+                recipes = recipes[:limit]
         return RecipesMiniSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
-class TagsSerializer(serializers.ModelSerializer):
+class TagsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for tags."""
     class Meta:
         model = Tags
@@ -118,7 +147,7 @@ class TagsSerializer(serializers.ModelSerializer):
         )
 
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class IngredientsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for ingredients."""
     class Meta:
         model = Ingredients
@@ -229,6 +258,7 @@ class RecipesWriteSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -240,23 +270,26 @@ class RecipesWriteSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         super().update(instance, validated_data)
-        instance.ingredients.clear()
-        self.create_or_update_ingredients(ingredients, instance)
+        with changing_recipes([instance.id]):
+            instance.ingredients.clear()
+            self.create_or_update_ingredients(ingredients, instance)
         instance.tags.set(tags)
         return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
         return RecipesReadSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            Recipes.objects.for_read(request.user).get(pk=instance.pk),
+            context={'request': request}
         ).data
 
 
-class RecipesReadSerializer(serializers.ModelSerializer):
+class RecipesReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for reading recipes."""
     tags = TagsSerializer(many=True)
     author = FoodgramUserSerializer(read_only=True)
@@ -277,17 +310,20 @@ class RecipesReadSerializer(serializers.ModelSerializer):
             'text',
             'cooking_time',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'favorites_count'
         )
 
     @staticmethod
     def get_ingredients(obj):
         return IngredientsInRecipesSerializer(
-            IngredientsInRecipes.objects.filter(recipe=obj),
+            obj.ingredient_in_recipe.all(),
             many=True
         ).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return bool(
             request
@@ -299,6 +335,8 @@ class RecipesReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return bool(
             request
@@ -322,73 +360,78 @@ class RecipesMiniSerializer(RecipesReadSerializer):
         )
 
 
-class FavoriteWriteSerializer(serializers.ModelSerializer):
-    """Serializer for favorite."""
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
+class UserRecipeWriteSerializer(serializers.ModelSerializer):
+    """
+    Base serializer for adding recipes to a user's list. Adding and
+    removing run as a single statement, the recipe is not looked up
+    beforehand.
+    """
+    user = serializers.IntegerField()
+    recipe = serializers.IntegerField()
+    already_added = ''
+    not_added = ''
 
-    def validate(self, data):
-        favorite = Favorite.objects.filter(
-            user=self.context.get('request').user,
-            recipe=data['recipe'].id
+    def create(self, validated_data):
+        recipe = self.Meta.model.objects.add(
+            validated_data['user'], validated_data['recipe']
         )
-        if self.context.get('request').method == 'POST':
-            if favorite.exists():
-                raise serializers.ValidationError(
-                    'Recipe already added to favorites.'
-                )
-        if self.context.get('request').method == 'DELETE':
-            if not favorite.exists():
-                raise serializers.ValidationError(
-                    'Recipe not added to favorites.'
-                )
-        return data
+        if recipe is None:
+            raise serializers.ValidationError({
+                'recipe': [
+                    f'Invalid pk "{validated_data["recipe"]}" - '
+                    'object does not exist.'
+                ]
+            })
+        if not recipe.created:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [self.already_added]
+            })
+        return recipe
 
     def destroy(self):
-        return Favorite.objects.filter(
-            user=self.validated_data['user'].id,
-            recipe=self.validated_data['recipe'].id
-        ).delete()
+        exists, removed = self.Meta.model.objects.remove(
+            self.validated_data['user'], self.validated_data['recipe']
+        )
+        if not exists:
+            raise NotFound()
+        if not removed:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [self.not_added]
+            })
 
     def to_representation(self, instance):
         return RecipesMiniSerializer(
-            instance.recipe,
+            instance,
             context={'request': self.context.get('request')}
         ).data
 
 
-class ShoppingCartWriteSerializer(serializers.ModelSerializer):
+class FavoriteWriteSerializer(UserRecipeWriteSerializer):
+    """Serializer for favorite."""
+    already_added = 'Recipe already added to favorites.'
+    not_added = 'Recipe not added to favorites.'
+
+    class Meta:
+        model = Favorite
+        fields = ('user', 'recipe')
+
+
+class ShoppingCartWriteSerializer(UserRecipeWriteSerializer):
     """Serializer for shopping_cart."""
+    already_added = 'Recipe already added to shopping cart.'
+    not_added = 'Recipe not added to shopping cart.'
+
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe')
 
-    def validate(self, data):
-        shopping_cart = ShoppingCart.objects.filter(
-            user=self.context.get('request').user,
-            recipe=data['recipe'].id
-        )
-        if self.context.get('request').method == 'POST':
-            if shopping_cart.exists():
-                raise serializers.ValidationError(
-                    'Recipe already added to shopping cart.'
-                )
-        if self.context.get('request').method == 'DELETE':
-            if not shopping_cart.exists():
-                raise serializers.ValidationError(
-                    'Recipe not added to shopping cart.'
-                )
-        return data
-
-    def destroy(self):
-        return ShoppingCart.objects.filter(
-            user=self.validated_data['user'].id,
-            recipe=self.validated_data['recipe'].id
-        ).delete()
 
-    def to_representation(self, instance):
-        return RecipesMiniSerializer(
-            instance.recipe,
-            context={'request': self.context.get('request')}
-        ).data
+class BatchSerializer(serializers.Serializer):
+    """Ids of the objects of a batch request."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(
+            min_value=1, max_value=constants.MAX_ID
+        ),
+        allow_empty=False,
+        max_length=constants.MAX_BATCH_SIZE
+    )
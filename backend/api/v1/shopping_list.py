@@ -0,0 +1,234 @@
+import csv
+import hashlib
+import json
+import os
+from tempfile import mkstemp
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from foodgram.cache import get_version
+from recipes.models import ShoppingCartTotals
+
+FONT_NAME = 'Roboto'
+FONT_PATH = settings.BASE_DIR / 'RobotoMono[wght].ttf'
+# Bump to invalidate stored PDFs when the layout changes.
+LAYOUT_VERSION = 1
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def register_font():
+    """Parse the font once per process."""
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def get_cart_rows(user):
+    """Ingredients of the user's shopping cart summed by name and unit."""
+    return ShoppingCartTotals.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount'
+    ).order_by('ingredient__name')
+
+
+def get_digest(rows):
+    """Hash the rows in the database without loading them."""
+    sql, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT md5(string_agg(row_to_json(cart)::text, ',' "
+            f'ORDER BY row_to_json(cart)::text)) FROM ({sql}) AS cart',
+            params
+        )
+        content = f'{LAYOUT_VERSION}:{cursor.fetchone()[0]}'
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class ShoppingListCanvas:
+    """Draw rows on as many pages as needed, with a header on each."""
+
+    top = 800
+    bottom = 50
+    line_height = 20
+
+    def __init__(self, file):
+        register_font()
+        self.pdf = canvas.Canvas(file)
+        self.page = 0
+        self.start_page()
+
+    def start_page(self):
+        self.page += 1
+        self.pdf.setFont(FONT_NAME, 14)
+        self.pdf.drawString(100, self.top, 'Shopping Cart')
+        self.pdf.setFont(FONT_NAME, 10)
+        self.pdf.drawString(500, self.bottom - 20, str(self.page))
+        self.pdf.setFont(FONT_NAME, 14)
+        self.y_position = self.top - self.line_height
+
+    def draw_line(self, text):
+        if self.y_position < self.bottom:
+            self.pdf.showPage()
+            self.start_page()
+        self.pdf.drawString(100, self.y_position, text)
+        self.y_position -= self.line_height
+
+    def save(self):
+        self.pdf.showPage()
+        self.pdf.save()
+
+
+def render_pdf(rows, file):
+    shopping_list = ShoppingListCanvas(file)
+    for ingredient in rows:
+        shopping_list.draw_line(
+            f'{ingredient["ingredient__name"]} - '
+            f'{ingredient["amount"]} '
+            f'{ingredient["ingredient__measurement_unit"]}'
+        )
+    shopping_list.save()
+
+
+def remove_older_pdfs(directory, written):
+    """Delete the PDFs in the directory written before the time."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                if entry.stat().st_mtime < written:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def get_shopping_list_pdf(user):
+    """
+    Open the PDF of the user's shopping list.
+
+    PDFs are kept per user under the hash of the aggregated cart. A new
+    one is rendered to a temporary file and renamed into place, so that
+    concurrent downloads never see a partial file, then the user's
+    older PDFs are removed. The returned file stays readable even if a
+    newer download removes it meanwhile. Rows are read with a server
+    side cursor, so large carts do not have to fit in memory.
+    """
+    directory = os.path.join(settings.SHOPPING_LIST_ROOT, str(user.pk))
+    rows = get_cart_rows(user)
+    path = os.path.join(directory, f'{get_digest(rows)}.pdf')
+    # Files are opened by descriptor: their path may be gone by the
+    # time the response is sent.
+    try:
+        return open(os.open(path, os.O_RDONLY), 'rb')
+    except FileNotFoundError:
+        pass
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = mkstemp(suffix='.tmp', dir=directory)
+    file = open(descriptor, 'w+b')
+    try:
+        render_pdf(rows.iterator(), file)
+        file.flush()
+        os.replace(temporary_path, path)
+    except BaseException:
+        file.close()
+        os.unlink(temporary_path)
+        raise
+    remove_older_pdfs(directory, os.fstat(descriptor).st_mtime)
+    file.seek(0)
+    return file
+
+
+class Echo:
+    """File-like object that returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_text(rows):
+    for ingredient in rows:
+        yield (
+            f'{ingredient["ingredient__name"]} - '
+            f'{ingredient["amount"]} '
+            f'{ingredient["ingredient__measurement_unit"]}\n'
+        )
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in rows:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def stream_json(rows):
+    separator = '['
+    for ingredient in rows:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+EXPORTS = {
+    'txt': ('text/plain; charset=utf-8', stream_text),
+    'csv': ('text/csv; charset=utf-8', stream_csv),
+    'json': ('application/json', stream_json),
+}
+
+
+def stream_shopping_list(user, export_format):
+    """
+    Return the content type and a generator of the shopping list in a
+    text format. Rows are read one by one with a server side cursor.
+    """
+    content_type, stream = EXPORTS[export_format]
+    return content_type, stream(get_cart_rows(user).iterator())
+
+
+def get_shopping_list_etag(user):
+    """
+    Tag of the user's aggregated cart. It changes with the user's totals,
+    with a rebuild of all totals and with the ingredient catalog.
+    """
+    versions = (
+        get_version('shopping_list'),
+        get_version('shopping_list', user.pk),
+        get_version('ingredients'),
+    )
+    return f'"shopping-list-{user.pk}-' + '-'.join(map(str, versions)) + '"'
+
+
+def get_shopping_list(user, etag):
+    """The user's aggregated cart as JSON ready data, cached by etag."""
+    key = f'shopping_list:{etag}'
+    data = cache.get(key)
+    if data is None:
+        data = [
+            {
+                'id': total['ingredient'],
+                'name': total['ingredient__name'],
+                'measurement_unit': total['ingredient__measurement_unit'],
+                'amount': total['amount'],
+            }
+            for total in get_cart_rows(user).values(
+                'ingredient',
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                'amount'
+            )
+        ]
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
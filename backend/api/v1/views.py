@@ -1,12 +1,17 @@
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+import os
+
+from django.core.cache import cache
+from django.db.models import (
+    BooleanField,
+    Prefetch,
+    Value,
+    prefetch_related_objects
+)
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from rest_framework import viewsets, status
+from rest_framework import renderers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import (
     IsAuthenticated,
@@ -23,21 +28,94 @@ from api.v1.serializers import (
     SubscribeSerializer,
     SubscribeWriteSerializer,
     FavoriteWriteSerializer,
-    ShoppingCartWriteSerializer
+    ShoppingCartWriteSerializer,
+    BatchSerializer,
+    get_recipes_limit
 )
 from recipes.models import (
     Tags,
     Ingredients,
+    Favorite,
     Recipes,
-    IngredientsInRecipes
+    ShoppingCart
 )
-from api.v1.filters import RecipeFilter, IngredientFilter
+from api.v1.catalog import catalog_response, get_catalog
+from api.v1.conditional import VERSION_FIELDS, get_validators, set_validators
+from api.v1.filters import RecipeFilter
 from api.v1.permissions import IsRecipeOwner
+from api.v1.renderers import (
+    CSVRenderer,
+    ExportNegotiation,
+    PDFRenderer,
+    TextRenderer
+)
+from api.v1.shopping_list import (
+    get_shopping_list,
+    get_shopping_list_etag,
+    get_shopping_list_pdf,
+    stream_shopping_list
+)
+from foodgram.cache import get_version
+from foodgram.paginators import FeedPagination
+
+
+def apply_batch(request, queryset, write_serializer, excluded=()):
+    """
+    Add or remove the objects of a batch request with one statement and
+    report the outcome for each id as the single object endpoint would.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    if request.method == 'POST':
+        apply, done_status = queryset.add_many, status.HTTP_201_CREATED
+        conflict = write_serializer.already_added
+    else:
+        apply, done_status = queryset.remove_many, status.HTTP_204_NO_CONTENT
+        conflict = write_serializer.not_added
+    results = apply(
+        request.user.id,
+        [object_id for object_id in ids if object_id not in excluded]
+    )
+    items = []
+    for object_id in ids:
+        if object_id in excluded:
+            item = {
+                'status': status.HTTP_400_BAD_REQUEST,
+                'detail': write_serializer.self_subscription
+            }
+        else:
+            exists, done = results[object_id]
+            if done:
+                item = {'status': done_status}
+            elif exists:
+                item = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'detail': conflict
+                }
+            else:
+                item = {
+                    'status': status.HTTP_404_NOT_FOUND,
+                    'detail': 'Not found.'
+                }
+        items.append({'id': object_id, **item})
+    return Response(items)
 
 
 class FoodgramUserViewSet(UserViewSet):
     """Viewset for user."""
     queryset = FoodgramUser.objects.all()
+    pagination_class = FeedPagination
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'me': 2,
+        'create': 5,
+        'set_password': 2,
+        'get_subscriptions': 4,
+        'get_subscribe': 7,
+        'subscribe_batch': 5,
+    }
 
     def get_permissions(self):
         if self.action == 'me':
@@ -53,15 +131,21 @@ class FoodgramUserViewSet(UserViewSet):
     def get_subscriptions(self, request):
         user = request.user
         queryset = FoodgramUser.objects.filter(
-            followers__in=Subscriptions.objects.select_related(
-                'followed_user'
-            ).filter(
-                subscriber=user
-            )
+            followers__subscriber=user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
         )
         subscriptions = self.paginate_queryset(
             queryset
         )
+        prefetch_related_objects(subscriptions, Prefetch(
+            'recipes',
+            queryset=Recipes.objects.first_per_author(
+                [author.pk for author in subscriptions],
+                get_recipes_limit(request)
+            ),
+            to_attr='limited_recipes'
+        ))
         serializer = SubscribeSerializer(
             subscriptions,
             many=True,
@@ -78,7 +162,6 @@ class FoodgramUserViewSet(UserViewSet):
     def get_subscribe(self, request, id):
         user = request.user
         data = {'subscriber': user.id, 'followed_user': id}
-        get_object_or_404(FoodgramUser, id=id)
         serializer = SubscribeWriteSerializer(
             data=data,
             context={'request': request}
@@ -91,12 +174,44 @@ class FoodgramUserViewSet(UserViewSet):
             serializer.destroy()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='subscribe/batch',
+        permission_classes=(IsAuthenticated, )
+    )
+    def subscribe_batch(self, request):
+        return apply_batch(
+            request,
+            Subscriptions.objects,
+            SubscribeWriteSerializer,
+            excluded={request.user.id}
+        )
+
 
 class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     """Viewset for tags."""
     queryset = Tags.objects.all()
     serializer_class = TagsSerializer
     pagination_class = None
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+    def list(self, request, *args, **kwargs):
+        version = get_version('tags')
+        etag = f'"tags-{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = f'tags:{version}'
+            data = cache.get(key)
+            if data is None:
+                data = list(
+                    self.get_serializer(self.get_queryset(), many=True).data
+                )
+                cache.set(key, data, None)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, no-cache'
+        return response
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
@@ -104,13 +219,83 @@ class RecipesViewSet(viewsets.ModelViewSet):
     queryset = Recipes.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = FeedPagination
     permission_classes = (IsRecipeOwner, IsAuthenticatedOrReadOnly,)
+    query_budgets = {
+        'list': 8,
+        'retrieve': 7,
+        'create': 18,
+        'update': 23,
+        'partial_update': 23,
+        'destroy': 10,
+        'get_favorite': 5,
+        'shopping_cart': 7,
+        'favorite_batch': 5,
+        'shopping_cart_batch': 7,
+        'download_shopping_cart': 3,
+        'shopping_list': 2,
+    }
+
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Recipes.objects.for_read(self.request.user)
+        return super().get_queryset()
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipesReadSerializer
         return RecipesWriteSerializer
 
+    def list(self, request, *args, **kwargs):
+        """
+        Paginate just the version and ordering columns of the recipes
+        first and answer a conditional request from them, then load only
+        that page for serialization.
+        """
+        queryset = self.filter_queryset(Recipes.objects.all())
+        ordering = queryset.query.order_by or Recipes._meta.ordering
+        page = self.paginate_queryset(queryset.only(
+            *VERSION_FIELDS, *(field.lstrip('-') for field in ordering)
+        ))
+        etag, last_modified = get_validators(
+            request,
+            [
+                tuple(getattr(recipe, field) for field in VERSION_FIELDS)
+                for recipe in page
+            ],
+            self.paginator.get_page_state()
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            loaded = self.get_queryset().in_bulk(
+                [recipe.pk for recipe in page]
+            )
+            serializer = self.get_serializer(
+                [loaded[recipe.pk] for recipe in page if recipe.pk in loaded],
+                many=True
+            )
+            response = self.get_paginated_response(serializer.data)
+        return set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            row = Recipes.objects.filter(pk=kwargs['pk']).values_list(
+                *VERSION_FIELDS
+            ).first()
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = get_validators(request, [row])
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
     @action(
         methods=['POST', 'DELETE'],
         detail=True,
@@ -128,7 +313,6 @@ class RecipesViewSet(viewsets.ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            get_object_or_404(Recipes, id=pk)
             serializer.is_valid(raise_exception=True)
             serializer.destroy()
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -150,50 +334,81 @@ class RecipesViewSet(viewsets.ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            get_object_or_404(Recipes, id=pk)
             serializer.is_valid(raise_exception=True)
             serializer.destroy()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
-        methods=['GET'],
+        methods=['POST', 'DELETE'],
         detail=False,
-        url_path='download_shopping_cart',
+        url_path='favorite/batch',
         permission_classes=(IsAuthenticated,)
     )
-    def download_shopping_cart(self, request):
+    def favorite_batch(self, request):
+        return apply_batch(request, Favorite.objects, FavoriteWriteSerializer)
 
-        ingredients = IngredientsInRecipes.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            'attachment; '
-            'filename="shopping_cart.pdf"'
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        return apply_batch(
+            request, ShoppingCart.objects, ShoppingCartWriteSerializer
         )
 
-        pdfmetrics.registerFont(TTFont('Roboto', 'RobotoMono[wght].ttf'))
-
-        pdf = canvas.Canvas(response)
-        pdf.setFont('Roboto', 14)
-        pdf.drawString(100, 800, 'Shopping Cart')
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='shopping_list',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_list(self, request):
+        etag = get_shopping_list_etag(request.user)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(get_shopping_list(request.user, etag))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Authorization',))
+        return response
 
-        y_position = 780
-        for ingredient in ingredients:
-            ingredient_line = (
-                f'{ingredient["ingredient__name"]} - '
-                f'{ingredient["amount"]} '
-                f'{ingredient["ingredient__measurement_unit"]}'
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='download_shopping_cart',
+        permission_classes=(IsAuthenticated,),
+        content_negotiation_class=ExportNegotiation,
+        renderer_classes=(
+            PDFRenderer,
+            TextRenderer,
+            CSVRenderer,
+            renderers.JSONRenderer
+        )
+    )
+    def download_shopping_cart(self, request):
+        export_format = request.accepted_renderer.format
+        if export_format != 'pdf':
+            content_type, content = stream_shopping_list(
+                request.user, export_format
             )
-            pdf.drawString(100, y_position, ingredient_line)
-            y_position -= 20
-
-        pdf.showPage()
-        pdf.save()
-
+            response = StreamingHttpResponse(
+                content, content_type=content_type
+            )
+            response['Content-Disposition'] = (
+                'attachment; '
+                f'filename="shopping_cart.{export_format}"'
+            )
+            return response
+        pdf = get_shopping_list_pdf(request.user)
+        response = FileResponse(
+            pdf,
+            as_attachment=True,
+            filename='shopping_cart.pdf',
+            content_type='application/pdf'
+        )
+        response['Content-Length'] = os.fstat(pdf.fileno()).st_size
         return response
 
 
@@ -203,5 +418,16 @@ class IngredientsViewSet(viewsets.ModelViewSet):
     serializer_class = IngredientsSerializer
     pagination_class = None
     http_method_names = ['get']
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return catalog_response(request, get_catalog())
+        limit = None
+        if 'limit' in request.query_params:
+            try:
+                limit = max(int(request.query_params['limit']), 0)
+            except ValueError:
+                pass
+        return Response(get_catalog().search(name, limit))
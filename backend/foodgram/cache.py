@@ -0,0 +1,48 @@
+"""
+Versioned cache namespaces. Bumping a version invalidates what every
+worker cached under it, so the cache has to be shared by all workers.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(*parts):
+    return 'version:' + ':'.join(str(part) for part in parts)
+
+
+def get_version(*parts):
+    """
+    Return the version of a cached namespace.
+
+    Versions are timestamps of the last change, so they can also be
+    used as Last-Modified values.
+    """
+    return cache.get_or_set(version_key(*parts), time.time, None)
+
+
+def get_versions(*namespaces):
+    """Return the versions of several namespaces with one cache read."""
+    keys = [version_key(*parts) for parts in namespaces]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    now = time.time()
+    if missing:
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, now) for key in keys]
+
+
+def bump_version(*parts):
+    """Invalidate everything cached under the namespace."""
+    cache.set(version_key(*parts), time.time(), None)
+
+
+def bump_version_on_commit(*parts):
+    """
+    Invalidate the namespace once the current transaction commits, so
+    that nobody caches the old data under the new version meanwhile.
+    """
+    transaction.on_commit(lambda: bump_version(*parts))
@@ -4,3 +4,15 @@ COLOR_LENGTH = 7
 
 MIN_TIME = MIN_INGREDIENTS = 1
 MAX_TIME = MAX_INGREDIENTS = 32000
+
+MAX_BATCH_SIZE = 100
+# Largest primary key, ids are bigint columns.
+MAX_ID = 2 ** 63 - 1
+
+# Popularity of recipes: favorites and cart additions weighted by age,
+# halving every POPULARITY_HALF_LIFE_DAYS. Scores are measured from a
+# fixed epoch so that they only change when recipes get new events.
+POPULARITY_EPOCH = '2024-01-01T00:00:00+00:00'
+POPULARITY_HALF_LIFE_DAYS = 14
+FAVORITE_WEIGHT = 1
+SHOPPING_CART_WEIGHT = 2
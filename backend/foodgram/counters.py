@@ -0,0 +1,80 @@
+"""
+Denormalized counter columns. Write paths shift them with F expressions
+in the same transaction as the rows they count, reconcile() recomputes
+them from those rows.
+"""
+from django.apps import apps
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+# Counter field and the model and foreign key of the rows it counts.
+COUNTERS = (
+    ('users.FoodgramUser', 'recipes_count', 'recipes.Recipes', 'author'),
+    (
+        'users.FoodgramUser',
+        'followers_count',
+        'users.Subscriptions',
+        'followed_user'
+    ),
+    ('recipes.Recipes', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipes', 'in_carts_count', 'recipes.ShoppingCart', 'recipe'),
+)
+
+
+def shift(model, field, ids, delta, **values):
+    """
+    Add delta to the counter of the objects, never going below zero,
+    and set other fields to values in the same statement.
+    """
+    if delta < 0:
+        value = Greatest(F(field) + delta, 0)
+    else:
+        value = F(field) + delta
+    model.objects.filter(pk__in=ids).update(**{field: value}, **values)
+
+
+def reconcile(label, field, counted_label, foreign_key, batch_size=None):
+    """
+    Recompute a counter, return the number of rows that drifted. With
+    batch_size rows are updated that many ids at a time, each batch
+    commits on its own unless the caller holds a transaction.
+    """
+    model = apps.get_model(label)
+    counted = apps.get_model(counted_label)
+    table = model._meta.db_table
+    column = model._meta.get_field(field).column
+    counted_column = counted._meta.get_field(foreign_key).column
+    drifted = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(id) FROM {table}')
+        last_id = cursor.fetchone()[0] or 0
+        step = batch_size or last_id
+        for after in range(0, last_id, step):
+            cursor.execute(
+                f'''
+                UPDATE {table} AS counter
+                SET {column} = actual.value
+                FROM (
+                    SELECT target.id, COUNT(counted.id) AS value
+                    FROM {table} AS target
+                    LEFT JOIN {counted._meta.db_table} AS counted
+                        ON counted.{counted_column} = target.id
+                    WHERE target.id > %s AND target.id <= %s
+                    GROUP BY target.id
+                ) AS actual
+                WHERE counter.id = actual.id
+                    AND counter.{column} <> actual.value
+                ''',
+                [after, after + step]
+            )
+            drifted += cursor.rowcount
+    return drifted
+
+
+def reconcile_all(batch_size=None):
+    """Recompute every counter, return the drift of each."""
+    return {
+        f'{label}.{field}': reconcile(label, field, *counted, batch_size)
+        for label, field, *counted in COUNTERS
+    }
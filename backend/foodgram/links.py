@@ -0,0 +1,213 @@
+"""
+Statements for link tables such as favorites, shopping carts and
+subscriptions, which connect a user to other objects.
+
+Each toggle is one statement: the requested ids are checked against the
+target table and the rows are inserted or deleted in the same query.
+They are safe under concurrent requests: a duplicate insert does
+nothing and a missing row is not deleted.
+"""
+from django.db import connection, models, transaction
+
+from foodgram.signals import links_added, links_removed
+
+
+def get_columns(model, user_field, object_field):
+    object_field = model._meta.get_field(object_field)
+    return (
+        model._meta.db_table,
+        model._meta.get_field(user_field).column,
+        object_field.column,
+        object_field.related_model._meta.db_table,
+    )
+
+
+def add_link(model, user_field, object_field, user_id, object_id):
+    """
+    Link the user to the object and return the object with a created
+    flag, or None if the object does not exist.
+    """
+    table, user_column, object_column, targets = get_columns(
+        model, user_field, object_field
+    )
+    target_model = model._meta.get_field(object_field).related_model
+    return next(iter(target_model._default_manager.raw(
+        f'''
+        WITH inserted AS (
+            INSERT INTO {table} ({user_column}, {object_column})
+            SELECT %s, id FROM {targets} WHERE id = %s
+            ON CONFLICT DO NOTHING
+            RETURNING id
+        )
+        SELECT target.*, EXISTS (SELECT 1 FROM inserted) AS created
+        FROM {targets} AS target
+        WHERE target.id = %s
+        ''',
+        [user_id, object_id, object_id]
+    )), None)
+
+
+def remove_link(model, user_field, object_field, user_id, object_id):
+    """
+    Unlink the user from the object. Return whether the object exists
+    and whether the link was removed.
+    """
+    table, user_column, object_column, targets = get_columns(
+        model, user_field, object_field
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            WITH deleted AS (
+                DELETE FROM {table}
+                WHERE {user_column} = %s AND {object_column} = %s
+                RETURNING id
+            )
+            SELECT
+                EXISTS (SELECT 1 FROM {targets} WHERE id = %s),
+                EXISTS (SELECT 1 FROM deleted)
+            ''',
+            [user_id, object_id, object_id]
+        )
+        return cursor.fetchone()
+
+
+def add_links(model, user_field, object_field, user_id, object_ids):
+    """
+    Link the user to the objects. Return a dict mapping every requested
+    id to whether the object exists and whether the link was created.
+    """
+    table, user_column, object_column, targets = get_columns(
+        model, user_field, object_field
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            WITH requested AS (
+                SELECT DISTINCT unnest(%s::bigint[]) AS id
+            ),
+            found AS (
+                SELECT target.id FROM {targets} AS target
+                JOIN requested ON requested.id = target.id
+            ),
+            inserted AS (
+                INSERT INTO {table} ({user_column}, {object_column})
+                SELECT %s, id FROM found
+                ON CONFLICT DO NOTHING
+                RETURNING {object_column} AS id
+            )
+            SELECT
+                requested.id,
+                found.id IS NOT NULL,
+                inserted.id IS NOT NULL
+            FROM requested
+            LEFT JOIN found ON found.id = requested.id
+            LEFT JOIN inserted ON inserted.id = requested.id
+            ''',
+            [list(object_ids), user_id]
+        )
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def remove_links(model, user_field, object_field, user_id, object_ids):
+    """
+    Unlink the user from the objects. Return a dict mapping every
+    requested id to whether the object exists and whether the link was
+    removed.
+    """
+    table, user_column, object_column, targets = get_columns(
+        model, user_field, object_field
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            WITH requested AS (
+                SELECT DISTINCT unnest(%s::bigint[]) AS id
+            ),
+            deleted AS (
+                DELETE FROM {table}
+                WHERE {user_column} = %s
+                    AND {object_column} IN (SELECT id FROM requested)
+                RETURNING {object_column} AS id
+            )
+            SELECT
+                requested.id,
+                EXISTS (
+                    SELECT 1 FROM {targets} AS target
+                    WHERE target.id = requested.id
+                ),
+                deleted.id IS NOT NULL
+            FROM requested
+            LEFT JOIN deleted ON deleted.id = requested.id
+            ''',
+            [list(object_ids), user_id]
+        )
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def get_changed(results):
+    return [
+        object_id for object_id, (_, changed) in results.items() if changed
+    ]
+
+
+class LinkQuerySet(models.QuerySet):
+    """
+    Toggles of a link model between user_field and object_field. They
+    send links_added and links_removed in the same transaction when
+    rows change.
+    """
+
+    user_field = 'user'
+    object_field = None
+
+    def link(self, function, user_id, object_ids):
+        return function(
+            self.model,
+            self.user_field,
+            self.object_field,
+            user_id,
+            object_ids
+        )
+
+    def add(self, user_id, object_id):
+        """See add_link()."""
+        with transaction.atomic():
+            target = self.link(add_link, user_id, object_id)
+            if target is not None and target.created:
+                links_added.send(
+                    sender=self.model, user_id=user_id, object_ids=[object_id]
+                )
+        return target
+
+    def remove(self, user_id, object_id):
+        """See remove_link(), returns (exists, removed)."""
+        with transaction.atomic():
+            exists, removed = self.link(remove_link, user_id, object_id)
+            if removed:
+                links_removed.send(
+                    sender=self.model, user_id=user_id, object_ids=[object_id]
+                )
+        return exists, removed
+
+    def add_many(self, user_id, object_ids):
+        """Batch form of add(), returns {id: (exists, created)}."""
+        with transaction.atomic():
+            results = self.link(add_links, user_id, object_ids)
+            created = get_changed(results)
+            if created:
+                links_added.send(
+                    sender=self.model, user_id=user_id, object_ids=created
+                )
+        return results
+
+    def remove_many(self, user_id, object_ids):
+        """Batch form of remove(), returns {id: (exists, removed)}."""
+        with transaction.atomic():
+            results = self.link(remove_links, user_id, object_ids)
+            removed = get_changed(results)
+            if removed:
+                links_removed.send(
+                    sender=self.model, user_id=user_id, object_ids=removed
+                )
+        return results
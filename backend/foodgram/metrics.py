@@ -0,0 +1,236 @@
+import copy
+import hmac
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+COUNTERS = (
+    (
+        'db_queries',
+        'foodgram_http_db_queries_total',
+        'Database queries run by requests.',
+    ),
+    (
+        'db_seconds',
+        'foodgram_http_db_duration_seconds_total',
+        'Time requests spent in the database.',
+    ),
+    (
+        'serializer_seconds',
+        'foodgram_http_serializer_duration_seconds_total',
+        'Time requests spent in serializers.',
+    ),
+    (
+        'response_bytes',
+        'foodgram_http_response_size_bytes_total',
+        'Size of response bodies.',
+    ),
+)
+
+_current_request = ContextVar('metrics_request', default=None)
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process, keyed by route and method.
+
+    With METRICS_DIR set, every worker writes its totals to its own file
+    in that directory and the exposition sums all files, so gunicorn
+    workers report as one service.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.flushed_at = 0
+
+    @staticmethod
+    def new_series():
+        return {
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            'count': 0,
+            'seconds': 0.0,
+            **{name: 0 for name, *_ in COUNTERS},
+        }
+
+    def observe(self, route, method, seconds, stats, response_bytes):
+        bucket = next(
+            (
+                index for index, bound in enumerate(LATENCY_BUCKETS)
+                if seconds <= bound
+            ),
+            len(LATENCY_BUCKETS)
+        )
+        with self.lock:
+            series = self.series.setdefault(
+                f'{route}|{method}', self.new_series()
+            )
+            series['buckets'][bucket] += 1
+            series['count'] += 1
+            series['seconds'] += seconds
+            series['db_queries'] += stats['db_queries']
+            series['db_seconds'] += stats['db_seconds']
+            series['serializer_seconds'] += stats['serializer_seconds']
+            series['response_bytes'] += response_bytes
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if time.monotonic() - self.flushed_at > interval:
+            self.flush()
+
+    @property
+    def path(self):
+        return Path(settings.METRICS_DIR) / f'{os.getpid()}.json'
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not settings.METRICS_DIR:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            content = json.dumps(self.series)
+        temporary = self.path.with_suffix('.tmp')
+        temporary.write_text(content)
+        os.replace(temporary, self.path)
+
+    def collect(self):
+        """Sum the series of every worker."""
+        with self.lock:
+            sources = [copy.deepcopy(self.series)]
+        if settings.METRICS_DIR:
+            for path in Path(settings.METRICS_DIR).glob('*.json'):
+                if path != self.path:
+                    sources.append(json.loads(path.read_text()))
+        total = {}
+        for source in sources:
+            for key, series in source.items():
+                merged = total.setdefault(key, self.new_series())
+                for name, value in series.items():
+                    if name == 'buckets':
+                        merged[name] = [
+                            left + right
+                            for left, right in zip(merged[name], value)
+                        ]
+                    else:
+                        merged[name] += value
+        return total
+
+    def render(self):
+        """Render the metrics in the Prometheus text format."""
+        metric = 'foodgram_http_request_duration_seconds'
+        lines = [
+            f'# HELP {metric} Request latency.',
+            f'# TYPE {metric} histogram',
+        ]
+        collected = sorted(self.collect().items())
+        for key, series in collected:
+            route, method = key.split('|')
+            labels = f'route="{route}",method="{method}"'
+            cumulative = 0
+            bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+            for bound, count in zip(bounds, series['buckets']):
+                cumulative += count
+                lines.append(
+                    f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{metric}_sum{{{labels}}} {series["seconds"]}')
+            lines.append(f'{metric}_count{{{labels}}} {series["count"]}')
+        for name, metric, description in COUNTERS:
+            lines += [
+                f'# HELP {metric} {description}',
+                f'# TYPE {metric} counter',
+            ]
+            for key, series in collected:
+                route, method = key.split('|')
+                lines.append(
+                    f'{metric}{{route="{route}",method="{method}"}} '
+                    f'{series[name]}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class TimedSerializerMixin:
+    """Count time spent in the outermost serializer towards the request."""
+
+    def to_representation(self, instance):
+        stats = _current_request.get()
+        if stats is None or stats['depth']:
+            return super().to_representation(instance)
+        stats['depth'] += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats['depth'] -= 1
+            stats['serializer_seconds'] += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Record latency, database work and response size per route."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {
+            'db_queries': 0,
+            'db_seconds': 0.0,
+            'serializer_seconds': 0.0,
+            'depth': 0,
+        }
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['db_queries'] += 1
+                stats['db_seconds'] += time.perf_counter() - started
+
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else 'unmatched',
+            request.method,
+            time.perf_counter() - started,
+            stats,
+            0 if response.streaming else len(response.content),
+        )
+        return response
+
+
+def metrics_view(request):
+    """
+    Expose the metrics of all workers in the Prometheus text format to
+    scrapers presenting METRICS_TOKEN. Without a token the endpoint does
+    not exist.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    if not hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponseForbidden()
+    registry.flush()
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,7 +1,329 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections, router
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination
+)
+from rest_framework.utils.urls import replace_query_param
+
+from foodgram.cache import get_version
+
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATE, COUNT_NONE)
+
+
+class UncountedPage(Page):
+    """Page that knows whether a next page exists without a count."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator with a configurable count strategy.
+
+    ``exact`` runs COUNT(*), ``cached`` keeps the count per query for a
+    short time and drops it on writes, ``estimate`` reads the planner
+    row estimate for unfiltered lists and ``none`` skips the count.
+    Without an exact count, pages fetch one extra row to find out
+    whether there is a next page.
+    """
+
+    def __init__(self, object_list, per_page, count_strategy=COUNT_EXACT,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+
+    @property
+    def is_counted(self):
+        return self.count_strategy in (COUNT_EXACT, COUNT_CACHED)
+
+    @cached_property
+    def count(self):
+        if self.count_strategy == COUNT_CACHED:
+            return self.get_cached_count()
+        if self.count_strategy == COUNT_ESTIMATE:
+            return self.get_estimated_count()
+        if self.count_strategy == COUNT_NONE:
+            return None
+        return super().count
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return 0
+        return super().num_pages
+
+    def get_cached_count(self):
+        query = self.object_list.values('pk').order_by().query
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        label = self.object_list.model._meta.label_lower
+        signature = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        key = f'count:{label}:{get_version("count", label)}:{signature}'
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if queryset.query.where or connection.vendor != 'postgresql':
+            return self.get_cached_count()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return self.get_cached_count()
+        return int(row[0])
+
+    def page(self, number):
+        if self.is_counted:
+            return super().page(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        bottom = (number - 1) * self.per_page
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1]
+        )
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        return UncountedPage(
+            object_list[:self.per_page],
+            number,
+            self,
+            has_next=len(object_list) > self.per_page
+        )
 
 
 class LimitPagination(PageNumberPagination):
     """Pagination class."""
     page_size_query_param = 'limit'
     page_size = 6
+    count_query_param = 'count'
+
+    def get_count_strategy(self, request):
+        strategy = request.query_params.get(self.count_query_param)
+        if strategy in COUNT_STRATEGIES:
+            return strategy
+        return settings.PAGINATION_COUNT_STRATEGY
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CountingPaginator,
+            count_strategy=self.get_count_strategy(request)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the whole ordering.
+
+    The ordering is the one the queryset was explicitly given, such as
+    a sort chosen by a filter, or the primary key. It is completed with
+    the primary key, so rows never tie, and all its fields must sort in
+    the same direction. A cursor holds the ordering values of the row
+    it starts after, and the page is read with one row comparison on
+    them, which an index on the same fields answers at any depth.
+    """
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        if queryset.query.order_by:
+            ordering = tuple(queryset.query.order_by)
+        else:
+            ordering = super().get_ordering(request, queryset, view)
+        descending = ordering[-1].startswith('-')
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if descending else 'id',)
+        assert all(
+            field.startswith('-') == descending for field in ordering
+        ), 'Cursor pagination needs fields sorted in the same direction.'
+        return ordering
+
+    def get_fields(self, model):
+        return [
+            model._meta.get_field(field.lstrip('-'))
+            for field in self.ordering
+        ]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = self.get_fields(queryset.model)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        descending = self.ordering[0].startswith('-') != reverse
+        queryset = queryset.order_by(*(
+            f'-{field.name}' if descending else field.name
+            for field in self.fields
+        ))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_seek(
+                queryset.model, descending, self.cursor.position
+            ))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_seek(self, model, descending, position):
+        """Condition for rows after the position in the read order."""
+        quote = connections[router.db_for_read(model)].ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ', '.join(
+            f'{table}.{quote(field.column)}' for field in self.fields
+        )
+        placeholders = ', '.join('%s' for _ in self.fields)
+        return RawSQL(
+            f'({columns}) {"<" if descending else ">"} ({placeholders})',
+            [
+                field.to_python(value)
+                for field, value in zip(self.fields, position)
+            ],
+            output_field=BooleanField()
+        )
+
+    def get_position(self, instance):
+        return [field.value_to_string(instance) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self.get_position(self.page[-1])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(0, False, position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self.get_position(self.page[0])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(0, True, position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position = [str(value) for value in tokens['p']]
+            if len(position) != len(self.fields):
+                raise ValueError
+            for field, value in zip(self.fields, position):
+                field.to_python(value)
+            return Cursor(0, bool(tokens.get('r')), position)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': cursor.position}
+        if cursor.reverse:
+            tokens['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(tokens).encode())
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode()
+        )
+
+
+class FeedPagination(LimitPagination):
+    """
+    Page number pagination with an opt-in cursor mode.
+
+    ``?pagination=cursor`` switches to keyset pagination, which returns
+    opaque next/previous cursors instead of page numbers and a count,
+    so deep pages cost the same as the first one.
+    """
+    mode_query_param = 'pagination'
+    cursor_pagination_class = LimitCursorPagination
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_page_state(self):
+        """Count and links the paginated response adds to the results."""
+        if self.cursor_paginator is not None:
+            paginator = self.cursor_paginator
+            count = None
+        else:
+            paginator = self
+            count = self.page.paginator.count
+        return (
+            count,
+            paginator.get_next_link(),
+            paginator.get_previous_link()
+        )
@@ -0,0 +1,107 @@
+import cProfile
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+
+def is_staff(request):
+    """Check the session user first, then the API token."""
+    if request.user.is_staff:
+        return True
+    try:
+        credentials = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return credentials is not None and credentials[0].is_staff
+
+
+def wants_profile(request):
+    return bool(
+        settings.PROFILE_DIR
+        and (PROFILE_HEADER in request.META or PROFILE_PARAM in request.GET)
+        and is_staff(request)
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Run a single request of a staff user under cProfile when it carries
+    the X-Profile header or the _profile query parameter.
+
+    The pstats dump and the SQL trace are saved to PROFILE_DIR, the name
+    of the files is returned in the X-Profile-Id response header. Open
+    the dump with pstats, snakeviz or flameprof.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+        queries = []
+
+        def trace_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    'sql': sql,
+                    'params': repr(params),
+                    'many': many,
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                })
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(trace_query):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming:
+                    # Streamed content is rendered after the middleware
+                    # returns, collect it here to profile it too.
+                    response.streaming_content = [
+                        b''.join(response.streaming_content)
+                    ]
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+        profile_id = self.save(request, profiler, queries, elapsed)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    @staticmethod
+    def save(request, profiler, queries, elapsed):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        route = (
+            request.resolver_match.view_name
+            if request.resolver_match else 'unmatched'
+        )
+        profile_id = (
+            f'{datetime.now():%Y%m%d-%H%M%S-%f}-{route}-{request.method}'
+        )
+        profiler.dump_stats(directory / f'{profile_id}.prof')
+        (directory / f'{profile_id}.sql.json').write_text(json.dumps(
+            {
+                'method': request.method,
+                'path': request.get_full_path(),
+                'total_ms': round(elapsed * 1000, 3),
+                'sql_ms': round(sum(query['ms'] for query in queries), 3),
+                'queries': queries,
+            },
+            ensure_ascii=False,
+            indent=2,
+        ))
+        return profile_id
@@ -0,0 +1,78 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+# Budgets are measured with an in-process cache. Memcached, used in
+# production, issues no SQL, while the database cache would add its own
+# queries to every count.
+BUDGET_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A block of code ran more queries than its budget allows."""
+
+
+def fingerprint(sql):
+    """Replace literals so the same query with other values matches."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\?(?:, \?)*\)', '(?)', sql)
+
+
+def get_report(queries, budget, label=''):
+    fingerprints = Counter(fingerprint(query['sql']) for query in queries)
+    lines = [
+        f'{label or "Block"} ran {len(queries)} queries, '
+        f'budget is {budget}.'
+    ]
+    duplicated = [
+        (count, sql) for sql, count in fingerprints.most_common() if count > 1
+    ]
+    if duplicated:
+        lines.append('Duplicated queries:')
+        lines += [f'  {count} x {sql}' for count, sql in duplicated]
+    return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(budget, label=''):
+    """Fail if the block runs more than budget queries."""
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if len(context.captured_queries) > budget:
+        raise QueryBudgetExceeded(
+            get_report(context.captured_queries, budget, label)
+        )
+
+
+def get_endpoint_budget(path, method):
+    """
+    Return the budget a viewset declares for the action serving the
+    request, or None if the action has no budget.
+    """
+    view = resolve(path.split('?')[0]).func
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(method.lower())
+    budgets = getattr(getattr(view, 'cls', None), 'query_budgets', {})
+    return budgets.get(action)
+
+
+@contextmanager
+def endpoint_query_budget(path, method='get'):
+    """Fail if a request runs more queries than its endpoint budget."""
+    budget = get_endpoint_budget(path, method)
+    if budget is None:
+        raise QueryBudgetExceeded(
+            f'{method.upper()} {path} has no declared query budget'
+        )
+    with query_budget(budget, f'{method.upper()} {path}') as context:
+        yield context
@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -103,6 +105,45 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'foodgram.paginators.LimitPagination',
 }
 
+PAGINATION_COUNT_STRATEGY = os.getenv('PAGINATION_COUNT_STRATEGY', 'exact')
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 30)
+)
+
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Rendered shopping list PDFs, kept out of MEDIA_ROOT which nginx serves.
+SHOPPING_LIST_ROOT = os.getenv(
+    'SHOPPING_LIST_ROOT', os.path.join(BASE_DIR, 'shopping_lists')
+)
+
+# Cache versions (foodgram.cache) invalidate data held by every worker,
+# so the cache must be shared between processes. Memcached answers
+# version reads without touching the database. The database cache also
+# works (CACHE_BACKEND, manage.py createcachetable), but turns every
+# version read into a query. A per-process cache such as LocMemCache
+# only suits a single worker.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    'django.core.cache.backends.memcached.PyMemcacheCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    }
+}
+if CACHE_BACKEND.endswith('.DatabaseCache'):
+    # Versions and counts are kept per user, far more than the default
+    # 300 entries.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+# Sent by the single statement write paths, which bypass the model
+# signals, after rows linking a user to other objects were inserted or
+# deleted. Arguments: user_id and object_ids, the ids of the recipes or
+# of the followed users.
+links_added = Signal()
+links_removed = Signal()
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from api.v1.catalog import warm_up  # noqa: E402
+from api.v1.shopping_list import register_font  # noqa: E402
+
+warm_up()
+register_font()
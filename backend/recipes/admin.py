@@ -1,5 +1,9 @@
+from contextlib import contextmanager
+
 from django.contrib import admin
 
+from .cart_totals import changing_recipes
+
 from .models import (
     Tags,
     Ingredients,
@@ -11,6 +15,21 @@ from .models import (
 )
 
 
+@contextmanager
+def touching_recipes(recipe_ids):
+    """Mark recipes changed after their tags or ingredients in the block."""
+    yield
+    Recipes.objects.filter(pk__in=recipe_ids).touch()
+
+
+def get_recipe_ids(obj, form, change):
+    """The recipe of a row and, after a change, the one it was moved from."""
+    recipe_ids = {obj.recipe_id}
+    if change:
+        recipe_ids.add(form.initial['recipe'])
+    return recipe_ids
+
+
 @admin.register(Tags)
 class TagsAdmin(admin.ModelAdmin):
     list_display = (
@@ -70,6 +89,10 @@ class RecipesAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     filter_fields = ('name', 'tags')
 
+    def save_related(self, request, form, formsets, change):
+        with changing_recipes([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
 
 @admin.register(Favorite)
 class FavouriteAdmin(admin.ModelAdmin):
@@ -90,6 +113,19 @@ class TagsRecipesAdmin(admin.ModelAdmin):
     )
     search_fields = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        with touching_recipes(get_recipe_ids(obj, form, change)):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with touching_recipes([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe', flat=True))
+        with touching_recipes(recipe_ids):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(IngredientsInRecipes)
 class IngredientsInRecipesAdmin(admin.ModelAdmin):
@@ -99,3 +135,18 @@ class IngredientsInRecipesAdmin(admin.ModelAdmin):
         'recipe',
     )
     search_fields = ('name',)
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = get_recipe_ids(obj, form, change)
+        with changing_recipes(recipe_ids), touching_recipes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        recipe_ids = [obj.recipe_id]
+        with changing_recipes(recipe_ids), touching_recipes(recipe_ids):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe', flat=True))
+        with changing_recipes(recipe_ids), touching_recipes(recipe_ids):
+            super().delete_queryset(request, queryset)
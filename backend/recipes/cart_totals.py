@@ -0,0 +1,150 @@
+"""
+Maintenance of ShoppingCartTotals, the ingredients of every shopping
+cart summed per user.
+
+Totals change in the same transaction as the rows they are computed
+from: call add_recipes when recipes enter a cart or after they get
+ingredients, and remove_recipes when recipes leave a cart or before
+they lose ingredients.
+"""
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from foodgram.cache import bump_version
+from recipes.models import (
+    IngredientsInRecipes,
+    ShoppingCart,
+    ShoppingCartTotals
+)
+
+TOTALS = ShoppingCartTotals._meta.db_table
+CART = ShoppingCart._meta.db_table
+ITEMS = IngredientsInRecipes._meta.db_table
+
+# Amounts per ingredient contributed by the given recipes to the cart of
+# one user, without looking the cart up, so it works before and after
+# the cart rows change.
+USER_CONTRIBUTION_SQL = f'''
+    SELECT %(user_id)s, ingredient_id, SUM(amount) AS amount
+    FROM {ITEMS}
+    WHERE recipe_id = ANY(%(recipe_ids)s)
+    GROUP BY ingredient_id
+'''
+# Amounts per user and ingredient contributed by the given recipes to
+# every cart holding them.
+CARTS_CONTRIBUTION_SQL = f'''
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount) AS amount
+    FROM {CART} AS cart
+    JOIN {ITEMS} AS item ON item.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id = ANY(%(recipe_ids)s)
+    GROUP BY cart.user_id, item.ingredient_id
+'''
+ADD_SQL = f'''
+    INSERT INTO {TOTALS} (user_id, ingredient_id, amount)
+    {{contribution}}
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {TOTALS}.amount + EXCLUDED.amount
+    RETURNING user_id
+'''
+REMOVE_SQL = f'''
+    UPDATE {TOTALS} AS total
+    SET amount = GREATEST(total.amount - contribution.amount, 0)
+    FROM ({{contribution}}) AS contribution(user_id, ingredient_id, amount)
+    WHERE total.user_id = contribution.user_id
+        AND total.ingredient_id = contribution.ingredient_id
+    RETURNING total.id, total.amount, total.user_id
+'''
+EXPECTED_SQL = f'''
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount) AS amount
+    FROM {CART} AS cart
+    JOIN {ITEMS} AS item ON item.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, item.ingredient_id
+'''
+REBUILD_SQL = f'''
+    INSERT INTO {TOTALS} (user_id, ingredient_id, amount)
+    {EXPECTED_SQL}
+'''
+DIFFERENCE_SQL = f'''
+    SELECT COUNT(*)
+    FROM {TOTALS} AS total
+    FULL JOIN ({EXPECTED_SQL}) AS expected
+        ON expected.user_id = total.user_id
+        AND expected.ingredient_id = total.ingredient_id
+    WHERE total.amount IS DISTINCT FROM expected.amount
+'''
+
+
+def invalidate(user_ids):
+    """Drop cached shopping lists once the transaction commits."""
+    user_ids = set(user_ids)
+
+    def bump_versions():
+        for user_id in user_ids:
+            bump_version('shopping_list', user_id)
+
+    transaction.on_commit(bump_versions)
+
+
+def execute(cursor, sql, recipe_ids, user_id):
+    cursor.execute(
+        sql.format(contribution=(
+            CARTS_CONTRIBUTION_SQL if user_id is None
+            else USER_CONTRIBUTION_SQL
+        )),
+        {'recipe_ids': list(recipe_ids), 'user_id': user_id}
+    )
+
+
+def add_recipes(recipe_ids, user_id=None):
+    """
+    Add the ingredients of recipes to the totals of the user who put
+    them in the cart, or of every user whose cart holds them.
+    """
+    with connection.cursor() as cursor:
+        execute(cursor, ADD_SQL, recipe_ids, user_id)
+        invalidate(row[0] for row in cursor)
+
+
+def remove_recipes(recipe_ids, user_id=None):
+    """
+    Subtract the ingredients of recipes from the totals of the user who
+    takes them out of the cart, or of every user whose cart holds them.
+    """
+    with connection.cursor() as cursor:
+        execute(cursor, REMOVE_SQL, recipe_ids, user_id)
+        rows = cursor.fetchall()
+        invalidate(row[2] for row in rows)
+        emptied = [total_id for total_id, amount, _ in rows if not amount]
+        if emptied:
+            cursor.execute(
+                f'DELETE FROM {TOTALS} WHERE id = ANY(%s)', [emptied]
+            )
+
+
+@contextmanager
+def changing_recipes(recipe_ids):
+    """
+    Keep the totals right while the ingredients of recipes are replaced
+    in the block.
+    """
+    recipe_ids = list(recipe_ids)
+    with transaction.atomic():
+        remove_recipes(recipe_ids)
+        yield
+        add_recipes(recipe_ids)
+
+
+def rebuild():
+    """Recompute all totals from the shopping carts."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TOTALS}')
+        cursor.execute(REBUILD_SQL)
+    transaction.on_commit(lambda: bump_version('shopping_list'))
+
+
+def count_differences():
+    """Number of totals that differ from the shopping carts."""
+    with connection.cursor() as cursor:
+        cursor.execute(DIFFERENCE_SQL)
+        return cursor.fetchone()[0]
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import cart_totals
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the aggregated shopping cart totals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report totals that differ from the shopping carts.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['verify']:
+            differences = cart_totals.count_differences()
+            if differences:
+                raise CommandError(
+                    f'{differences} shopping cart totals are out of date, '
+                    'run cart_totals to rebuild them'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Shopping cart totals are up to date'
+            ))
+            return
+        with transaction.atomic():
+            cart_totals.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Shopping cart totals rebuilt '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
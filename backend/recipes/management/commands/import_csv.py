@@ -1,19 +1,66 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
+from foodgram.cache import bump_version
 from recipes.models import Ingredients
 
 
 class Command(BaseCommand):
-    def import_ingredients(self):
-        with open('/data/ingredients.csv', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                Ingredients.objects.create(
-                    name=row['name'], measurement_unit=row['measurement_unit']
-                )
+    help = 'Import ingredients from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='/data/ingredients.csv',
+            help='CSV or JSON file with name and measurement_unit.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows inserted per statement.',
+        )
+
+    @staticmethod
+    def read_rows(path):
+        with open(path, encoding='utf-8') as file:
+            if path.suffix == '.json':
+                yield from json.load(file)
+            else:
+                yield from csv.DictReader(file)
+
+    def import_ingredients(self, path, batch_size):
+        rows = (
+            Ingredients(
+                name=row['name'], measurement_unit=row['measurement_unit']
+            )
+            for row in self.read_rows(path)
+        )
+        total = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return total
+            Ingredients.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
 
     def handle(self, *args, **options):
-        self.import_ingredients()
-        self.stdout.write(self.style.SUCCESS('Data imported successfully'))
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'File {path} does not exist')
+        started = time.monotonic()
+        before = Ingredients.objects.count()
+        total = self.import_ingredients(path, options['batch_size'])
+        inserted = Ingredients.objects.count() - before
+        bump_version('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Data imported successfully: {inserted} inserted, '
+            f'{total - inserted} skipped '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
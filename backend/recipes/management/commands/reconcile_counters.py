@@ -0,0 +1,40 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from foodgram.counters import reconcile_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute the counter columns of users and recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drifted counters, without fixing them.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Rows updated and committed at a time when fixing.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['check']:
+            with transaction.atomic():
+                drift = reconcile_all()
+                transaction.set_rollback(True)
+        else:
+            drift = reconcile_all(options['batch_size'])
+        for counter, rows in drift.items():
+            self.stdout.write(f'{counter}: {rows} rows drifted')
+        if options['check'] and any(drift.values()):
+            raise CommandError('Counters are out of date')
+        self.stdout.write(self.style.SUCCESS(
+            f'Counters {"checked" if options["check"] else "reconciled"} '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
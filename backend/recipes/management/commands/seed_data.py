@@ -0,0 +1,222 @@
+import io
+import random
+import time
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from foodgram.cache import bump_version
+from foodgram.counters import reconcile_all
+from recipes import cart_totals, popularity
+from recipes.models import (
+    Favorite,
+    Ingredients,
+    IngredientsInRecipes,
+    Recipes,
+    ShoppingCart,
+    Tags,
+    TagsRecipes
+)
+from users.models import FoodgramUser, Subscriptions
+
+BASE_VOLUMES = {
+    'users': 1000,
+    'recipes': 10000,
+    'favorites': 50000,
+    'shopping_cart': 10000,
+    'subscriptions': 20000,
+}
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'запеканка', 'каша', 'рагу', 'паста',
+    'куриный', 'овощной', 'сырный', 'грибной', 'домашний', 'быстрый',
+    'летний', 'пряный', 'сладкий', 'с', 'и', 'по-деревенски',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Populate the database with synthetic users, recipes, favorites, '
+        'shopping carts and subscriptions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Multiplier for the base volumes, 1 is 10 000 recipes.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed, the same seed generates the same data.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows inserted per statement.',
+        )
+
+    def bulk_create(self, model, objects):
+        ids = []
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return ids
+            ids += [obj.pk for obj in model.objects.bulk_create(batch)]
+
+    def copy_rows(self, model, fields, rows):
+        """
+        Stream integer rows into the model table with COPY. Only used for
+        rows that reference freshly created objects, so they cannot
+        conflict with existing ones.
+        """
+        columns = ', '.join(
+            model._meta.get_field(field).column for field in fields
+        )
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    return
+                cursor.copy_expert(
+                    f'COPY {model._meta.db_table} ({columns}) FROM STDIN',
+                    io.StringIO(''.join(
+                        '\t'.join(map(str, row)) + '\n' for row in batch
+                    ))
+                )
+
+    def power_law(self, population, exponent=1.1):
+        """Cumulative Zipf weights over a shuffled population."""
+        population = list(population)
+        self.random.shuffle(population)
+        weights = (
+            1 / (rank ** exponent) for rank in range(1, len(population) + 1)
+        )
+        return population, list(accumulate(weights))
+
+    def get_tag_ids(self):
+        if not Tags.objects.exists():
+            Tags.objects.bulk_create(
+                Tags(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+            bump_version('tags')
+        return list(Tags.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        prefix = f'seed{self.seed}-{FoodgramUser.objects.count()}'
+        password = make_password('password')
+        return self.bulk_create(FoodgramUser, (
+            FoodgramUser(
+                username=f'{prefix}-{number}',
+                email=f'{prefix}-{number}@example.com',
+                first_name='Seed',
+                last_name=f'User {number}',
+                password=password,
+            )
+            for number in range(count)
+        ))
+
+    def create_recipes(self, count, user_ids):
+        authors, cum_weights = self.power_law(user_ids)
+        return self.bulk_create(Recipes, (
+            Recipes(
+                name=' '.join(self.random.choices(WORDS, k=3)).capitalize(),
+                text=' '.join(self.random.choices(WORDS, k=40)),
+                image='recipes/images/seed.jpg',
+                author_id=author_id,
+                cooking_time=self.random.randint(5, 180),
+            )
+            for author_id in self.random.choices(
+                authors, cum_weights=cum_weights, k=count
+            )
+        ))
+
+    def create_recipe_links(self, recipe_ids, tag_ids, ingredient_ids):
+        self.copy_rows(TagsRecipes, ('recipe', 'tag'), (
+            (recipe_id, tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(
+                tag_ids, self.random.randint(1, min(3, len(tag_ids)))
+            )
+        ))
+        self.copy_rows(IngredientsInRecipes, (
+            'recipe', 'ingredient', 'amount'
+        ), (
+            (recipe_id, ingredient_id, self.random.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids,
+                self.random.randint(3, min(10, len(ingredient_ids)))
+            )
+        ))
+
+    def generate_pairs(self, count, left_ids, right_ids):
+        """
+        Yield about count unique pairs. Activity of the left side and
+        popularity of the right side both follow a power law.
+        """
+        right_ids, cum_weights = self.power_law(right_ids)
+        activity = [self.random.paretovariate(1.5) for _ in left_ids]
+        factor = count / sum(activity)
+        for left_id, weight in zip(left_ids, activity):
+            picks = min(round(weight * factor), len(right_ids) // 2)
+            chosen = set(self.random.choices(
+                right_ids, cum_weights=cum_weights, k=picks
+            ))
+            chosen.discard(left_id)
+            for right_id in chosen:
+                yield left_id, right_id
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        volumes = {
+            name: max(1, int(base * options['scale']))
+            for name, base in BASE_VOLUMES.items()
+        }
+        ingredient_ids = list(
+            Ingredients.objects.values_list('id', flat=True)
+        )
+        if len(ingredient_ids) < 10:
+            raise CommandError(
+                'Import the ingredient catalog first: manage.py import_csv'
+            )
+        started = time.monotonic()
+        tag_ids = self.get_tag_ids()
+        user_ids = self.create_users(volumes['users'])
+        recipe_ids = self.create_recipes(volumes['recipes'], user_ids)
+        self.create_recipe_links(recipe_ids, tag_ids, ingredient_ids)
+        self.copy_rows(Favorite, ('user', 'recipe'), self.generate_pairs(
+            volumes['favorites'], user_ids, recipe_ids
+        ))
+        self.copy_rows(ShoppingCart, ('user', 'recipe'), self.generate_pairs(
+            volumes['shopping_cart'], user_ids, recipe_ids
+        ))
+        # COPY skips the signals that maintain the totals.
+        cart_totals.rebuild()
+        self.copy_rows(
+            Subscriptions,
+            ('subscriber', 'followed_user'),
+            self.generate_pairs(volumes['subscriptions'], user_ids, user_ids)
+        )
+        # bulk_create and COPY skip the signals that maintain counters.
+        reconcile_all()
+        popularity.update(full=True)
+        bump_version('count', Recipes._meta.label_lower)
+        bump_version('count', FoodgramUser._meta.label_lower)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(user_ids)} users and {len(recipe_ids)} recipes '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes import popularity
+
+
+class Command(BaseCommand):
+    help = (
+        'Rescore the popularity of recipes whose favorites or shopping '
+        'carts changed. Meant to run periodically, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rescore every recipe, e.g. after changing the weights.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Recipes rescored per statement.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = popularity.update(options['batch_size'], options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Popularity of {updated} recipes updated '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.23 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_recipes_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tagsrecipes',
+            index=models.Index(fields=['tag', 'recipe'], name='tags_recipes_tag_recipe_idx'),
+        ),
+    ]
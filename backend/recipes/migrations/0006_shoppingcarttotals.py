@@ -0,0 +1,47 @@
+# Generated by Django 3.2.23 on 2026-10-18 21:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_tagsrecipes_tag_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to='recipes.ingredients', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'ordering': ('user', 'ingredient'),
+                'default_related_name': 'cart_totals',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotals',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_total'),
+        ),
+        migrations.RunSQL(
+            '''
+            INSERT INTO recipes_shoppingcarttotals
+                (user_id, ingredient_id, amount)
+            SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+            FROM recipes_shoppingcart AS cart
+            JOIN recipes_ingredientsinrecipes AS item
+                ON item.recipe_id = cart.recipe_id
+            GROUP BY cart.user_id, item.ingredient_id
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.23 on 2026-10-18 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The counters start at zero, the reconcile_counters command fills
+    # them in batches after deploy.
+
+    dependencies = [
+        ('users', '0010_foodgramuser_counters'),
+        ('recipes', '0006_shoppingcarttotals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Favorites count'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Shopping carts count'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.23 on 2026-10-18 23:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# The link tables are also written with raw SQL, which relies on the
+# database filling in the creation time.
+CREATED_DEFAULT_SQL = [
+    'ALTER TABLE recipes_favorite ALTER COLUMN created SET DEFAULT now()',
+    'ALTER TABLE recipes_shoppingcart '
+    'ALTER COLUMN created SET DEFAULT now()',
+]
+CREATED_DEFAULT_REVERSE_SQL = [
+    'ALTER TABLE recipes_favorite ALTER COLUMN created DROP DEFAULT',
+    'ALTER TABLE recipes_shoppingcart ALTER COLUMN created DROP DEFAULT',
+]
+FLAG_BATCH_SIZE = 10000
+FLAG_STALE_SQL = (
+    'UPDATE recipes_recipes SET popularity_stale = TRUE '
+    'WHERE id > %s AND id <= %s '
+    'AND (EXISTS (SELECT 1 FROM recipes_favorite '
+    'WHERE recipe_id = recipes_recipes.id) '
+    'OR EXISTS (SELECT 1 FROM recipes_shoppingcart '
+    'WHERE recipe_id = recipes_recipes.id))'
+)
+
+
+def flag_stale_recipes(apps, schema_editor):
+    """
+    Flag the recipes with favorites or cart rows for the first update,
+    one range of ids per statement so that rows are not locked for long.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(id) FROM recipes_recipes')
+        last_id = cursor.fetchone()[0] or 0
+        for after in range(0, last_id, FLAG_BATCH_SIZE):
+            cursor.execute(FLAG_STALE_SQL, [after, after + FLAG_BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not block writes to the table, but
+    # cannot run inside a transaction. Without one the stale flag is set
+    # and committed in batches.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0007_recipes_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Добавлено'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Добавлено'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(CREATED_DEFAULT_SQL, CREATED_DEFAULT_REVERSE_SQL),
+        migrations.AddField(
+            model_name='recipes',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Popularity'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='popularity_stale',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Popularity needs an update'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(fields=['-popularity', '-id'], name='recipes_popularity_idx'),
+        ),
+        migrations.RunPython(flag_stale_recipes, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(condition=models.Q(('popularity_stale', True)), fields=['id'], name='recipes_popularity_stale_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.23 on 2026-10-19 00:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    # The columns are added with a constant default, which Postgres 11+
+    # stores in the catalog without rewriting the table. Existing rows
+    # get the migration time and keep their relative order through the
+    # id that every ordering ends with. Cursor pages seek on
+    # (created_at, id) together, so this one large tie pages correctly.
+
+    dependencies = [
+        ('recipes', '0008_recipes_popularity'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipes',
+            options={'ordering': ('name', 'id'), 'verbose_name': 'Recipe', 'verbose_name_plural': 'Recipes'},
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Created'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Updated'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.23 on 2026-10-19 00:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not block writes to the table, but
+    # cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0009_recipes_timestamps'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(fields=['name', 'id'], name='recipes_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(fields=['-created_at', '-id'], name='recipes_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(fields=['cooking_time', 'id'], name='recipes_cooking_time_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(fields=['author', 'name', 'id'], name='recipes_author_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipes',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='recipes_author_created_idx'),
+        ),
+    ]
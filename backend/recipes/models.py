@@ -1,9 +1,12 @@
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 
-from users.models import FoodgramUser
+from users.models import FoodgramUser, Subscriptions
 from foodgram import constants
+from foodgram.links import LinkQuerySet
 
 
 class Ingredients(models.Model):
@@ -58,6 +61,95 @@ class Tags(models.Model):
         return self.name
 
 
+class RecipesQuerySet(models.QuerySet):
+    """Queryset for recipes."""
+
+    def with_user_flags(self, user):
+        """Annotate favorite and shopping cart flags for the user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk')
+                )
+            ),
+        )
+
+    def for_read(self, user):
+        """
+        Load everything the read serializer needs in a fixed number
+        of queries, regardless of how many recipes are fetched.
+        """
+        if user.is_authenticated:
+            is_subscribed = models.Exists(
+                Subscriptions.objects.filter(
+                    subscriber=user,
+                    followed_user=models.OuterRef('pk')
+                )
+            )
+        else:
+            is_subscribed = models.Value(
+                False, output_field=models.BooleanField()
+            )
+        return self.with_user_flags(user).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredient_in_recipe',
+                queryset=IngredientsInRecipes.objects.select_related(
+                    'ingredient'
+                )
+            ),
+            models.Prefetch(
+                'author',
+                queryset=FoodgramUser.objects.annotate(
+                    is_subscribed=is_subscribed
+                )
+            ),
+        )
+
+    def touch(self):
+        """Mark the recipes changed for conditional requests."""
+        return self.update(updated_at=timezone.now())
+
+    def first_per_author(self, author_ids, limit=None):
+        """
+        Recipes of the authors ordered by name, at most limit of each
+        author. Django cannot filter on a window function, so the
+        ranking runs in a raw subquery.
+        """
+        recipes = self.filter(author__in=author_ids).order_by('name', 'id')
+        if limit is None:
+            return recipes
+        return recipes.filter(id__in=RawSQL(
+            f'''
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY name, id
+                ) AS position
+                FROM {self.model._meta.db_table}
+                WHERE author_id = ANY(%s)
+            ) AS ranked
+            WHERE position <= %s
+            ''',
+            [list(author_ids), limit]
+        ))
+
+
 class Recipes(models.Model):
     """Recipes."""
     name = models.CharField(
@@ -109,11 +201,72 @@ class Recipes(models.Model):
         ],
 
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Favorites count',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Shopping carts count',
+        default=0,
+        editable=False,
+    )
+    popularity = models.FloatField(
+        verbose_name='Popularity',
+        default=0,
+        editable=False,
+    )
+    popularity_stale = models.BooleanField(
+        verbose_name='Popularity needs an update',
+        default=False,
+        editable=False,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Created',
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Updated',
+        auto_now=True,
+    )
+
+    objects = RecipesQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
-        ordering = ('name', 'author',)
+        # Every ordering of the recipe list, alone and after the author
+        # filter, ends with the id so that pages are stable, and has an
+        # index to read it from instead of sorting.
+        ordering = ('name', 'id')
+        indexes = [
+            models.Index(fields=['name', 'id'], name='recipes_name_idx'),
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='recipes_created_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                name='recipes_cooking_time_idx',
+            ),
+            models.Index(
+                fields=['-popularity', '-id'],
+                name='recipes_popularity_idx',
+            ),
+            models.Index(
+                fields=['author', 'name', 'id'],
+                name='recipes_author_name_idx',
+            ),
+            models.Index(
+                fields=['author', '-created_at', '-id'],
+                name='recipes_author_created_idx',
+            ),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(popularity_stale=True),
+                name='recipes_popularity_stale_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -138,6 +291,12 @@ class TagsRecipes(models.Model):
         verbose_name = 'Recipe tag'
         verbose_name_plural = 'Recipe tags'
         ordering = ('tag', 'recipe',)
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='tags_recipes_tag_recipe_idx',
+            )
+        ]
 
     def __str__(self):
         return f'{self.tag} {self.recipe}'
@@ -186,6 +345,12 @@ class IngredientsInRecipes(models.Model):
         return f'{self.ingredient} {self.recipe}'
 
 
+class UserRecipeQuerySet(LinkQuerySet):
+    """Toggles of a recipe in a user's list."""
+
+    object_field = 'recipe'
+
+
 class BaseForFavoriteAndShoppingCart(models.Model):
     """Базовый класс для списка покупок и избранного."""
     user = models.ForeignKey(
@@ -198,6 +363,12 @@ class BaseForFavoriteAndShoppingCart(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлено'
+    )
+
+    objects = UserRecipeQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -234,3 +405,36 @@ class Favorite(BaseForFavoriteAndShoppingCart):
         ]
         ordering = ('user', 'recipe')
         default_related_name = 'favorite'
+
+
+class ShoppingCartTotals(models.Model):
+    """
+    Ингредиенты списка покупок, просуммированные по пользователю.
+    Поддерживается в recipes.cart_totals.
+    """
+    user = models.ForeignKey(
+        FoodgramUser,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredients,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_total'
+            )
+        ]
+        ordering = ('user', 'ingredient')
+        default_related_name = 'cart_totals'
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.amount}'
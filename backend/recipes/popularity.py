@@ -0,0 +1,93 @@
+"""
+Popularity scores of recipes, stored in Recipes.popularity for ordering.
+
+Every favorite and cart addition adds its weight times
+2 ** (age since POPULARITY_EPOCH / half-life). This forward decay ranks
+recipes exactly like weights decaying from now, but a score only
+changes when rows of the recipe are added or removed. Write paths flag
+such recipes with popularity_stale and update() rescores just those.
+
+Scores grow with time: move POPULARITY_EPOCH forward and run a full
+update before they leave the float range, about 14 000 days after it.
+"""
+import math
+
+from django.db import connection
+
+from foodgram import constants
+from recipes.models import Favorite, Recipes, ShoppingCart
+
+RECIPES = Recipes._meta.db_table
+FAVORITES = Favorite._meta.db_table
+CARTS = ShoppingCart._meta.db_table
+
+RATE = math.log(2) / (constants.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60)
+
+# Rescore one batch of recipes, stale ones or the next ids after
+# %(after)s. Rows locked by concurrent writes are skipped, those writes
+# flag them stale again.
+UPDATE_SQL = f'''
+    WITH batch AS (
+        SELECT id FROM {RECIPES}
+        WHERE {{condition}}
+        ORDER BY id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    events AS (
+        SELECT recipe_id, created, %(favorite_weight)s AS weight
+        FROM {FAVORITES}
+        WHERE recipe_id IN (SELECT id FROM batch)
+        UNION ALL
+        SELECT recipe_id, created, %(cart_weight)s AS weight
+        FROM {CARTS}
+        WHERE recipe_id IN (SELECT id FROM batch)
+    ),
+    scores AS (
+        SELECT recipe_id, SUM(weight * EXP(
+            %(rate)s * EXTRACT(EPOCH FROM created - %(epoch)s::timestamptz)
+        )) AS score
+        FROM events
+        GROUP BY recipe_id
+    )
+    UPDATE {RECIPES} AS recipe
+    SET popularity = COALESCE(scores.score, 0), popularity_stale = FALSE
+    FROM batch
+    LEFT JOIN scores ON scores.recipe_id = batch.id
+    WHERE recipe.id = batch.id
+    RETURNING recipe.id
+'''
+STALE_CONDITION = 'popularity_stale'
+NEXT_CONDITION = 'id > %(after)s'
+
+
+def update_batch(condition, limit, after=0):
+    """Rescore one batch, return the ids of the rescored recipes."""
+    with connection.cursor() as cursor:
+        cursor.execute(UPDATE_SQL.format(condition=condition), {
+            'limit': limit,
+            'after': after,
+            'favorite_weight': constants.FAVORITE_WEIGHT,
+            'cart_weight': constants.SHOPPING_CART_WEIGHT,
+            'rate': RATE,
+            'epoch': constants.POPULARITY_EPOCH,
+        })
+        return [row[0] for row in cursor]
+
+
+def update(batch_size=1000, full=False):
+    """
+    Rescore stale recipes, or all of them with full, in batches of
+    batch_size. Each batch commits on its own unless the caller holds a
+    transaction. Return the number of rescored recipes.
+    """
+    updated, after = 0, 0
+    while True:
+        if full:
+            ids = update_batch(NEXT_CONDITION, batch_size, after)
+        else:
+            ids = update_batch(STALE_CONDITION, batch_size)
+        if not ids:
+            return updated
+        updated += len(ids)
+        after = max(ids)
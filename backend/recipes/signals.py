@@ -0,0 +1,166 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import receiver
+
+from foodgram import counters
+from foodgram.cache import bump_version_on_commit
+from foodgram.signals import links_added, links_removed
+from recipes import cart_totals
+from recipes.models import (
+    Favorite,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+    Tags,
+    TagsRecipes
+)
+from users.models import FoodgramUser
+
+LINK_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+@receiver(post_save, sender=Recipes)
+@receiver(post_delete, sender=Recipes)
+@receiver(post_save, sender=TagsRecipes)
+@receiver(post_delete, sender=TagsRecipes)
+@receiver(m2m_changed, sender=Recipes.tags.through)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(links_added, sender=Favorite)
+@receiver(links_removed, sender=Favorite)
+@receiver(links_added, sender=ShoppingCart)
+@receiver(links_removed, sender=ShoppingCart)
+def invalidate_recipe_counts(**kwargs):
+    """Drop cached recipe list counts after any write they depend on."""
+    bump_version_on_commit('count', Recipes._meta.label_lower)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def invalidate_recipe_state(instance, **kwargs):
+    """Change the validators of recipe responses for the user."""
+    bump_version_on_commit('recipe_state', instance.user_id)
+
+
+@receiver(links_added, sender=Favorite)
+@receiver(links_removed, sender=Favorite)
+@receiver(links_added, sender=ShoppingCart)
+@receiver(links_removed, sender=ShoppingCart)
+def invalidate_recipe_state_for_links(user_id, **kwargs):
+    bump_version_on_commit('recipe_state', user_id)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def invalidate_tags(**kwargs):
+    """Drop cached tag data after the tag table changes."""
+    bump_version_on_commit('tags')
+
+
+@receiver(post_save, sender=Ingredients)
+@receiver(post_delete, sender=Ingredients)
+def invalidate_ingredients(**kwargs):
+    """Rebuild the in-memory ingredient catalog after it changes."""
+    bump_version_on_commit('ingredients')
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def remove_from_cart_totals_on_change(instance, **kwargs):
+    if instance._state.adding:
+        return
+    previous = ShoppingCart.objects.filter(pk=instance.pk).values(
+        'user', 'recipe'
+    ).first()
+    if previous:
+        cart_totals.remove_recipes([previous['recipe']], previous['user'])
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_cart_totals(instance, **kwargs):
+    cart_totals.add_recipes([instance.recipe_id], instance.user_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_cart_totals(instance, **kwargs):
+    cart_totals.remove_recipes([instance.recipe_id], instance.user_id)
+
+
+@receiver(links_added, sender=ShoppingCart)
+def add_links_to_cart_totals(user_id, object_ids, **kwargs):
+    cart_totals.add_recipes(object_ids, user_id)
+
+
+@receiver(links_removed, sender=ShoppingCart)
+def remove_links_from_cart_totals(user_id, object_ids, **kwargs):
+    cart_totals.remove_recipes(object_ids, user_id)
+
+
+@receiver(post_save, sender=Recipes)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        counters.shift(
+            FoodgramUser, 'recipes_count', [instance.author_id], 1
+        )
+
+
+@receiver(post_delete, sender=Recipes)
+def count_deleted_recipe(instance, **kwargs):
+    counters.shift(FoodgramUser, 'recipes_count', [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_created_link(sender, instance, created, **kwargs):
+    """
+    Count new favorites and cart rows and flag their recipes for the
+    popularity update. Rows moved to another recipe in the admin are
+    left to the reconcile_counters command.
+    """
+    if created:
+        counters.shift(
+            Recipes,
+            LINK_COUNTERS[sender],
+            [instance.recipe_id],
+            1,
+            popularity_stale=True
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_deleted_link(sender, instance, **kwargs):
+    counters.shift(
+        Recipes,
+        LINK_COUNTERS[sender],
+        [instance.recipe_id],
+        -1,
+        popularity_stale=True
+    )
+
+
+@receiver(links_added, sender=Favorite)
+@receiver(links_added, sender=ShoppingCart)
+def count_added_links(sender, object_ids, **kwargs):
+    counters.shift(
+        Recipes, LINK_COUNTERS[sender], object_ids, 1, popularity_stale=True
+    )
+
+
+@receiver(links_removed, sender=Favorite)
+@receiver(links_removed, sender=ShoppingCart)
+def count_removed_links(sender, object_ids, **kwargs):
+    counters.shift(
+        Recipes, LINK_COUNTERS[sender], object_ids, -1, popularity_stale=True
+    )
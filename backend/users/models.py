@@ -3,6 +3,7 @@ from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
 
 from foodgram import constants
+from foodgram.links import LinkQuerySet
 
 
 class FoodgramUser(AbstractUser):
@@ -34,6 +35,16 @@ class FoodgramUser(AbstractUser):
         verbose_name='Password',
         max_length=constants.MAX_LENGTH_USERCHARFIELD,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Recipes count',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Followers count',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'User'
@@ -44,6 +55,23 @@ class FoodgramUser(AbstractUser):
         return self.username
 
 
+class SubscriptionsQuerySet(LinkQuerySet):
+    """Subscribe and unsubscribe toggles."""
+
+    user_field = 'subscriber'
+    object_field = 'followed_user'
+
+    def add(self, subscriber_id, followed_user_id):
+        """
+        Subscribe to the user and return them with a created flag, or
+        None if the user does not exist.
+        """
+        followed_user = super().add(subscriber_id, followed_user_id)
+        if followed_user is not None:
+            followed_user.is_subscribed = True
+        return followed_user
+
+
 class Subscriptions(models.Model):
     """Subscriptions."""
     subscriber = models.ForeignKey(
@@ -59,6 +87,8 @@ class Subscriptions(models.Model):
         verbose_name='Followed user',
     )
 
+    objects = SubscriptionsQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Subscription'
         verbose_name_plural = 'Subscriptions'
@@ -0,0 +1,88 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from foodgram import counters
+from foodgram.cache import bump_version_on_commit
+from foodgram.signals import links_added, links_removed
+from users.models import FoodgramUser, Subscriptions
+
+
+@receiver(post_save, sender=Subscriptions)
+@receiver(post_delete, sender=Subscriptions)
+@receiver(post_delete, sender=FoodgramUser)
+@receiver(links_added, sender=Subscriptions)
+@receiver(links_removed, sender=Subscriptions)
+def invalidate_user_counts(**kwargs):
+    """Drop cached user list counts after subscriptions change."""
+    bump_version_on_commit('count', FoodgramUser._meta.label_lower)
+
+
+# Fields of a user that recipe responses show for the author.
+SHOWN_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def get_shown_values(user):
+    """Loaded values of the shown fields, None for deferred ones."""
+    return tuple(user.__dict__.get(field) for field in SHOWN_FIELDS)
+
+
+@receiver(post_init, sender=FoodgramUser)
+def remember_shown_values(instance, **kwargs):
+    instance._shown_values = get_shown_values(instance)
+
+
+@receiver(post_save, sender=FoodgramUser)
+def invalidate_users(instance, created, **kwargs):
+    """
+    Change the validators of responses showing users after a change of
+    the shown fields. New users have no recipes to show them yet, and
+    logins or password changes leave the shown fields alone.
+    """
+    values = get_shown_values(instance)
+    if not created and (
+        values != instance._shown_values or None in instance._shown_values
+    ):
+        bump_version_on_commit('users')
+    instance._shown_values = values
+
+
+@receiver(post_save, sender=Subscriptions)
+@receiver(post_delete, sender=Subscriptions)
+def invalidate_recipe_state(instance, **kwargs):
+    """Change the validators of recipe responses for the subscriber."""
+    bump_version_on_commit('recipe_state', instance.subscriber_id)
+
+
+@receiver(links_added, sender=Subscriptions)
+@receiver(links_removed, sender=Subscriptions)
+def invalidate_recipe_state_for_links(user_id, **kwargs):
+    bump_version_on_commit('recipe_state', user_id)
+
+
+@receiver(post_save, sender=Subscriptions)
+def count_created_subscription(instance, created, **kwargs):
+    """
+    Count new subscriptions. Subscriptions moved to another user in the
+    admin are left to the reconcile_counters command.
+    """
+    if created:
+        counters.shift(
+            FoodgramUser, 'followers_count', [instance.followed_user_id], 1
+        )
+
+
+@receiver(post_delete, sender=Subscriptions)
+def count_deleted_subscription(instance, **kwargs):
+    counters.shift(
+        FoodgramUser, 'followers_count', [instance.followed_user_id], -1
+    )
+
+
+@receiver(links_added, sender=Subscriptions)
+def count_added_subscriptions(object_ids, **kwargs):
+    counters.shift(FoodgramUser, 'followers_count', object_ids, 1)
+
+
+@receiver(links_removed, sender=Subscriptions)
+def count_removed_subscriptions(object_ids, **kwargs):
+    counters.shift(FoodgramUser, 'followers_count', object_ids, -1)